@@ -1,4 +1,4 @@
-from fastapi import FastAPI, HTTPException, File, UploadFile, Form
+from fastapi import FastAPI, HTTPException, File, UploadFile, Form, Request, Response, Depends
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel
 from typing import Optional
@@ -8,7 +8,24 @@ from dotenv import load_dotenv
 # import openai
 from openai import AsyncOpenAI
 
-from agentResponse import AgentResponse
+from agentResponse import AUDIO_DELIVERY_MODE, AUDIO_PUBLIC_BASE_URL, AgentResponse
+from audio_store import parse_range
+from deadline import Deadline
+from diagnostics import DEBUG_ENDPOINTS_TOKEN, RoomTracker, create_debug_router
+from rate_limit import (
+    CALLER_TOKEN_SECRET,
+    RATE_LIMIT_BACKEND,
+    TRUSTED_PROXY_HOPS,
+    AdmissionController,
+    RateLimiter,
+    caller_identity,
+    create_rate_limit_backend,
+    request_priority,
+    retry_after_header,
+)
+from realtime_pool import REALTIME_POOL_LANGUAGES, RealtimeSessionPool
+from room_registry import REPLICA_ID, ROOM_LEASE_TTL_S, RoomLease, create_room_registry
+from transcript_sink import create_transcript_sink
 
 # Import LiveKit SDK components
 from livekit import rtc
@@ -21,9 +38,7 @@ from livekit.agents import (
     multimodal,
     llm
 )
-from livekit.plugins import openai
 
-import aiohttp
 import asyncio
 
 # Set up logging
@@ -33,6 +48,26 @@ logger.setLevel(logging.INFO)
 # Initialize OpenAI client
 client = AsyncOpenAI(api_key=os.getenv('OPENAI_API_KEY'))
 
+# Overall time budget for a /chat request across completion, TTS and upload
+CHAT_DEADLINE_S = float(os.getenv('CHAT_DEADLINE_S', '30'))
+
+# How long a started agent waits for the learner before tearing the room down
+LIVEKIT_JOIN_TIMEOUT_S = float(os.getenv('LIVEKIT_JOIN_TIMEOUT_S', '120'))
+
+# Per-caller quotas and load shedding (0 disables a limit). MAX_ACTIVE_ROOMS and
+# MAX_INFLIGHT_CHATS are per worker process, as are the quotas with the memory
+# RATE_LIMIT_BACKEND, so the service admits WEB_CONCURRENCY times these. Set
+# RATE_LIMIT_BACKEND=redis to share the quotas when running several workers.
+WEB_CONCURRENCY = int(os.getenv('WEB_CONCURRENCY', '1'))
+CHAT_RATE_PER_MIN = float(os.getenv('CHAT_RATE_PER_MIN', '30'))
+CHAT_BURST = float(os.getenv('CHAT_BURST', '10'))
+LIVEKIT_RATE_PER_MIN = float(os.getenv('LIVEKIT_RATE_PER_MIN', '6'))
+LIVEKIT_BURST = float(os.getenv('LIVEKIT_BURST', '3'))
+MAX_ACTIVE_ROOMS = int(os.getenv('MAX_ACTIVE_ROOMS', '200'))
+MAX_INFLIGHT_CHATS = int(os.getenv('MAX_INFLIGHT_CHATS', '64'))
+BACKGROUND_SHARE = float(os.getenv('BACKGROUND_SHARE', '0.5'))
+SHED_RETRY_AFTER_S = float(os.getenv('SHED_RETRY_AFTER_S', '2'))
+
 app = FastAPI()
 
 # Add CORS middleware
@@ -61,6 +96,7 @@ class ChatRequest(BaseModel):
 class ChatResponse(BaseModel):
     response: str
     audio_url: Optional[str] = None
+    audio_delivery: Optional[str] = None  # "inline", "memory" or "s3"
 
 class LiveKitRequest(BaseModel):
     room: str
@@ -74,9 +110,57 @@ agent_response = AgentResponse()
 # Global task storage
 active_agents = {}
 
-@app.post("/chat")
-async def chat(request: ChatRequest) -> ChatResponse:
+# Pre-connected realtime sessions for LiveKit rooms
+realtime_pool = RealtimeSessionPool()
+
+# Rooms claimed across all replicas, so only one of them starts an agent.
+# Created on startup, as the default backend opens a SQLite file.
+room_registry = None
+
+# Leases this replica holds, renewed in the background until release_room
+room_leases = {}
+
+# Batched transcript persistence for LiveKit sessions, created on startup
+transcript_sink = None
+
+# Weak references to per-room objects, for the debug endpoints
+room_tracker = RoomTracker()
+
+# Fairness quotas per caller and a cap on concurrent /chat work
+rate_limit_backend = create_rate_limit_backend()
+chat_limiter = RateLimiter("chat", CHAT_RATE_PER_MIN, CHAT_BURST, rate_limit_backend)
+livekit_limiter = RateLimiter("livekit", LIVEKIT_RATE_PER_MIN, LIVEKIT_BURST, rate_limit_backend)
+chat_admission = AdmissionController(MAX_INFLIGHT_CHATS, BACKGROUND_SHARE)
+
+if DEBUG_ENDPOINTS_TOKEN:
+    app.include_router(create_debug_router(
+        active_agents,
+        room_tracker,
+        lambda: {
+            "realtime_pool": realtime_pool.stats(),
+            "transcripts": transcript_sink.stats() if transcript_sink else None,
+            "chat_admission": chat_admission.stats(),
+            "model_router": agent_response.model_router.snapshot(),
+        }
+    ))
+    logger.info("Debug endpoints enabled under /debug")
+
+async def admit_chat(http_request: Request):
+    # Reject early rather than queue: quota first, then server capacity
+    retry_after = await chat_limiter.check(caller_identity(http_request))
+    if retry_after is not None:
+        raise HTTPException(status_code=429, detail="Too many requests", headers=retry_after_header(retry_after))
+    if not chat_admission.try_acquire(request_priority(http_request)):
+        raise HTTPException(status_code=503, detail="Server is busy", headers=retry_after_header(SHED_RETRY_AFTER_S))
+    try:
+        yield
+    finally:
+        chat_admission.release()
+
+@app.post("/chat", dependencies=[Depends(admit_chat)])
+async def chat(request: ChatRequest, http_request: Request) -> ChatResponse:
     logger.info(f"Received chat request: {request}")
+    deadline = Deadline(CHAT_DEADLINE_S)
     try:
         # Convert language to code
         language_code = {
@@ -98,18 +182,52 @@ async def chat(request: ChatRequest) -> ChatResponse:
         
         # Process message
         logger.info(f"Processing message: {request.message}")
-        response = await agent_response.process_input(request.message)
+        response = await agent_response.process_input(request.message, language_code, deadline)
+        
+        audio_url = response["audio_url"]
+        if response["audio_delivery"] == "memory":
+            # Clips in the local store are served by this API, not the web app
+            audio_url = f"{AUDIO_PUBLIC_BASE_URL or str(http_request.base_url).rstrip('/')}{audio_url}"
         
         api_response = ChatResponse(
             response=response["text"],
-            audio_url=response["audio_url"]
+            audio_url=audio_url,
+            audio_delivery=response["audio_delivery"]
         )
         logger.info(f"Sending response: {api_response}")
         return api_response
+    except asyncio.TimeoutError:
+        logger.error(f"Chat request exceeded its {CHAT_DEADLINE_S}s deadline")
+        raise HTTPException(status_code=504, detail="Timed out generating a response")
     except Exception as e:
         logger.error(f"Error processing chat request: {str(e)}", exc_info=True)
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.get("/audio/{audio_id}")
+async def get_audio(audio_id: str, request: Request):
+    clip = agent_response.audio_store.get(audio_id)
+    if not clip:
+        raise HTTPException(status_code=404, detail="Audio clip not found or expired")
+
+    size = len(clip.data)
+    headers = {"Accept-Ranges": "bytes", "Cache-Control": "private, max-age=300"}
+    try:
+        byte_range = parse_range(request.headers.get("range"), size)
+    except ValueError:
+        return Response(status_code=416, headers={**headers, "Content-Range": f"bytes */{size}"})
+
+    if byte_range is None:
+        return Response(content=clip.data, media_type=clip.content_type, headers=headers)
+
+    start, end = byte_range
+    headers["Content-Range"] = f"bytes {start}-{end}/{size}"
+    return Response(
+        content=clip.data[start:end + 1],
+        status_code=206,
+        media_type=clip.content_type,
+        headers=headers
+    )
+
 @app.get("/health")
 async def health_check():
     logger.info("Health check endpoint called")
@@ -117,6 +235,7 @@ async def health_check():
 
 @app.on_event("startup")
 async def startup_event():
+    global room_registry, transcript_sink
     logger.info("FastAPI application starting up")
     logger.info("Checking required environment variables:")
     openai_key = os.getenv("OPENAI_API_KEY", "").strip('"')  # Strip quotes
@@ -135,6 +254,22 @@ async def startup_event():
     logger.info(f"AWS Region is set to: {os.getenv('AWS_REGION', 'NOT SET')}")
     
     logger.info(f"DEEPGRAM_API_KEY is {'set' if os.getenv('DEEPGRAM_API_KEY') else 'NOT SET'}")
+    
+    if TRUSTED_PROXY_HOPS is None:
+        if CALLER_TOKEN_SECRET:
+            logger.warning("TRUSTED_PROXY_HOPS is not set; only callers with a caller token get per-caller quotas")
+        else:
+            logger.warning("Neither CALLER_TOKEN_SECRET nor TRUSTED_PROXY_HOPS is set; per-caller quotas are off, only load shedding applies")
+    if WEB_CONCURRENCY > 1 and RATE_LIMIT_BACKEND == 'memory':
+        logger.warning(f"{WEB_CONCURRENCY} workers with in-memory rate limits; each worker keeps its own quotas, set RATE_LIMIT_BACKEND=redis to share them")
+    
+    if AUDIO_DELIVERY_MODE == 'memory':
+        logger.warning("AUDIO_DELIVERY_MODE=memory keeps clips in this process; /audio needs a single worker or sticky routing")
+    
+    room_registry = create_room_registry()
+    transcript_sink = create_transcript_sink()
+    transcript_sink.start()
+    realtime_pool.start(REALTIME_POOL_LANGUAGES)
 
 @app.on_event("shutdown")
 async def shutdown_event():
@@ -143,6 +278,10 @@ async def shutdown_event():
     for room_name in list(active_agents.keys()):
         if room_name in active_agents:
             del active_agents[room_name]
+        await release_room(room_name)
+    await realtime_pool.aclose()
+    if transcript_sink:
+        await transcript_sink.aclose()
     if agent_response:
         agent_response.cleanup()
 
@@ -176,15 +315,22 @@ async def chat_audio(audio: UploadFile = File(...), language: str = Form("Englis
         logger.error(f"Error processing audio chat request: {str(e)}", exc_info=True)
         raise HTTPException(status_code=500, detail=str(e))
 
-async def create_and_start_agent(room: rtc.Room, language: str, room_name: str):
+async def create_and_start_agent(room: rtc.Room, language: str, room_name: str, lease: RoomLease):
     logger.info(f"Starting agent for language: {language} in room: {room_name}")
-    http_session = None
+    warm_session = None
     participant_connected = asyncio.Event()
     connection_closed = asyncio.Event()
     
     try:
-        # Create HTTP session for the OpenAI plugin
-        http_session = aiohttp.ClientSession()
+        # Take a pre-connected realtime session (or start connecting one now)
+        # so the upstream handshake overlaps with waiting for the participant
+        warm_session = realtime_pool.acquire(language)
+        room_tracker.track(
+            room_name,
+            room=room,
+            model=warm_session.model,
+            http_session=warm_session.http_session
+        )
         
         # Set up connection handlers
         @room.on("disconnected")
@@ -218,39 +364,38 @@ async def create_and_start_agent(room: rtc.Room, language: str, room_name: str):
         def on_track_subscribed(track, publication, participant):
             logger.info(f"Subscribed to track from {participant.identity}: {track.kind}")
             
-        # Wait for first participant
+        # Wait for first participant, unless the room goes away first. The
+        # realtime session is already open, so don't hold it forever either.
         logger.info("Waiting for participant to join...")
-        await participant_connected.wait()
+        participant_wait = asyncio.create_task(participant_connected.wait())
+        closed_wait = asyncio.create_task(connection_closed.wait())
+        lease_wait = asyncio.create_task(lease.lost.wait())
+        try:
+            await asyncio.wait(
+                {participant_wait, closed_wait, lease_wait},
+                timeout=LIVEKIT_JOIN_TIMEOUT_S or None,
+                return_when=asyncio.FIRST_COMPLETED
+            )
+        finally:
+            participant_wait.cancel()
+            closed_wait.cancel()
+            lease_wait.cancel()
+        if lease.lost.is_set():
+            logger.warning(f"Lost the lease on room {room_name} before a participant joined, closing")
+            return
+        if not participant_connected.is_set():
+            if connection_closed.is_set():
+                logger.info("Room closed before a participant joined")
+            else:
+                logger.info(f"No participant joined within {LIVEKIT_JOIN_TIMEOUT_S}s, closing room")
+            return
         
-        # Create and start the agent with realtime model
-        model = openai.realtime.RealtimeModel(
-            instructions=f"""You are an expert language instructor for {language}. Your teaching style is 
-encouraging, patient, and engaging. You should adapt your teaching approach based on 
-the student's proficiency level. Use a clear, standard accent that's easily 
-understandable for learners. Focus on:
-- Natural conversation practice in {language}
-- Gentle correction of pronunciation and grammar mistakes
-- Introducing relevant vocabulary in context
-- Providing cultural context when appropriate
-- Maintaining a supportive learning environment
-
-Keep interactions conversational while weaving in language learning opportunities.
-If the student makes a mistake, wait for them to finish speaking before offering
-corrections. Praise good usage and progress. Adjust your speaking pace and
-complexity based on the student's demonstrated ability level.""",
-            voice="alloy",
-            temperature=0.8,
-            modalities=["text", "audio"],
-            turn_detection=openai.realtime.ServerVadOptions(
-                threshold=0.5,
-                silence_duration_ms=200,
-                prefix_padding_ms=300,
-            ),
-            http_session=http_session  # Pass the HTTP session to the model
-        )
+        # The realtime session has been connecting while we waited
+        model = warm_session.model
         
         agent = multimodal.MultimodalAgent(model=model)
         agent.start(room)
+        room_tracker.track(room_name, agent=agent)
         logger.info("MultimodalAgent successfully started")
         
         # Initialize conversation
@@ -275,6 +420,7 @@ complexity based on the student's demonstrated ability level.""",
         @agent.on("user_speech_committed")
         def on_user_speech_committed(msg: llm.ChatMessage):
             logger.info(f"User speech committed: {msg.content}")
+            transcript_sink.record(room_name, "user", msg.content, language)
             
         @agent.on("agent_started_speaking")
         def on_agent_started_speaking():
@@ -287,12 +433,16 @@ complexity based on the student's demonstrated ability level.""",
         @agent.on("agent_speech_committed")
         def on_agent_speech_committed(msg: llm.ChatMessage):
             logger.info(f"Agent speech committed: {msg.content}")
+            transcript_sink.record(room_name, "agent", msg.content, language)
         
         # Keep the connection alive and monitor participant
         while room_name in active_agents and not connection_closed.is_set():
             if not participant_connected.is_set():
                 logger.info("No participants in room, closing")
                 break
+            if lease.lost.is_set():
+                logger.warning(f"Lost the lease on room {room_name} to another replica, closing")
+                break
             await asyncio.sleep(1)
             
     except Exception as e:
@@ -300,21 +450,50 @@ complexity based on the student's demonstrated ability level.""",
     finally:
         if room_name in active_agents:
             del active_agents[room_name]
-        if http_session:
-            await http_session.close()
+        await release_room(room_name)
+        await transcript_sink.flush_room(room_name)
+        if warm_session:
+            await warm_session.aclose()
         try:
             await room.disconnect()
         except Exception as e:
             logger.error(f"Error disconnecting room: {str(e)}", exc_info=True)
 
+async def release_room(room_name: str):
+    lease = room_leases.pop(room_name, None)
+    if lease:
+        await lease.release()
+
 @app.post("/livekit-agent")
-async def create_livekit_agent(request: LiveKitRequest):
+async def create_livekit_agent(request: LiveKitRequest, http_request: Request):
     logger.info(f"Received LiveKit agent request: {request}")
     room = None
+    
+    # Check if agent already exists for this room
+    if request.room in active_agents:
+        return {"status": "success", "message": "LiveKit agent already running"}
+    
+    # Limit room starts per signed-in user, or per client address
+    retry_after = await livekit_limiter.check(caller_identity(http_request))
+    if retry_after is not None:
+        raise HTTPException(status_code=429, detail="Too many agent requests", headers=retry_after_header(retry_after))
+    
+    # Re-check after awaiting the limiter, then reserve the room before the
+    # next await so concurrent requests for it can't both get past here
+    if request.room in active_agents:
+        return {"status": "success", "message": "LiveKit agent already running"}
+    if MAX_ACTIVE_ROOMS and len(active_agents) >= MAX_ACTIVE_ROOMS:
+        raise HTTPException(status_code=503, detail="No capacity for another room", headers=retry_after_header(SHED_RETRY_AFTER_S))
+    active_agents[request.room] = None
+    
     try:
-        # Check if agent already exists for this room
-        if request.room in active_agents:
+        # Another replica may already be running this room
+        lease = RoomLease(room_registry, request.room, REPLICA_ID, ROOM_LEASE_TTL_S)
+        if not await lease.claim():
+            logger.info(f"Room {request.room} is already claimed by another replica")
+            del active_agents[request.room]
             return {"status": "success", "message": "LiveKit agent already running"}
+        room_leases[request.room] = lease
             
         # Convert language to code
         language_code = {
@@ -344,7 +523,7 @@ async def create_livekit_agent(request: LiveKitRequest):
         logger.info(f"Successfully connected to LiveKit room: {request.room}")
 
         # Create and start the agent as a background task
-        task = asyncio.create_task(create_and_start_agent(room, request.language, request.room))
+        task = asyncio.create_task(create_and_start_agent(room, request.language, request.room, lease))
         active_agents[request.room] = task
         
         return {"status": "success", "message": "LiveKit agent started"}
@@ -358,6 +537,7 @@ async def create_livekit_agent(request: LiveKitRequest):
                 logger.error(f"Error disconnecting room: {str(disconnect_error)}", exc_info=True)
         if request.room in active_agents:
             del active_agents[request.room]
+        await release_room(request.room)
         raise HTTPException(status_code=500, detail=str(e))
 
 if __name__ == "__main__":
@@ -8,10 +8,17 @@ from botocore.exceptions import ClientError
 import io
 import botocore
 import random
+import base64
+from botocore.config import Config
 from typing import Optional
 from dotenv import load_dotenv
 from openai import AsyncOpenAI
 
+from audio_store import AudioStore
+from deadline import Deadline, HedgeBudget, LatencyTracker
+from model_router import ModelRouter
+from single_flight import SingleFlight, normalize_text
+
 # Load environment variables
 load_dotenv()
 
@@ -25,6 +32,33 @@ AWS_SECRET_ACCESS_KEY = os.getenv('AWS_SECRET_ACCESS_KEY', '').strip()
 AWS_REGION = os.getenv('AWS_REGION', '').strip()
 AWS_S3_BUCKET_AUDIO = os.getenv('AWS_S3_BUCKET_AUDIO', '').strip()
 OPENAI_API_KEY = os.getenv('OPENAI_API_KEY', '').strip('"')
+SINGLE_FLIGHT_MAX_WAITERS = int(os.getenv('SINGLE_FLIGHT_MAX_WAITERS', '64'))
+
+# Per-stage timeouts (seconds); each is also clipped to the request deadline.
+# The audio stage covers one TTS call and its upload, so keep
+# AUDIO_TIMEOUT_S >= TTS_TIMEOUT_S + S3_UPLOAD_TIMEOUT_S.
+COMPLETION_TIMEOUT_S = float(os.getenv('COMPLETION_TIMEOUT_S', '20'))
+AUDIO_TIMEOUT_S = float(os.getenv('AUDIO_TIMEOUT_S', '15'))
+TTS_TIMEOUT_S = float(os.getenv('TTS_TIMEOUT_S', '10'))
+S3_UPLOAD_TIMEOUT_S = float(os.getenv('S3_UPLOAD_TIMEOUT_S', '5'))
+
+# Hedged TTS: fire a second request if the first is slower than the observed p95
+TTS_HEDGE_ENABLED = os.getenv('TTS_HEDGE_ENABLED', 'false').lower() == 'true'
+TTS_HEDGE_DEFAULT_DELAY_S = float(os.getenv('TTS_HEDGE_DEFAULT_DELAY_S', '3'))
+# Upper bound on the share of TTS requests that may send a hedge (0.1 = 10%)
+TTS_HEDGE_MAX_RATE = float(os.getenv('TTS_HEDGE_MAX_RATE', '0.1'))
+
+# Audio delivery: 's3' always uploads; 'inline' returns small clips as data URLs;
+# 'memory' keeps small clips in a short-lived local store served from /audio/{id}.
+# The memory store is per process: only use it with a single worker and replica,
+# or with sticky routing for /audio, otherwise most fetches land elsewhere and 404.
+# Clip URLs are absolute, built from AUDIO_PUBLIC_BASE_URL (set it when behind a
+# proxy) or else from the base URL of the /chat request.
+AUDIO_DELIVERY_MODE = os.getenv('AUDIO_DELIVERY_MODE', 's3').lower()
+AUDIO_LOCAL_MAX_BYTES = int(os.getenv('AUDIO_LOCAL_MAX_BYTES', str(64 * 1024)))
+AUDIO_STORE_TTL_S = float(os.getenv('AUDIO_STORE_TTL_S', '300'))
+AUDIO_STORE_MAX_BYTES = int(os.getenv('AUDIO_STORE_MAX_BYTES', str(64 * 1024 * 1024)))
+AUDIO_PUBLIC_BASE_URL = os.getenv('AUDIO_PUBLIC_BASE_URL', '').rstrip('/')
 
 # Language configurations
 LANGUAGE_CONFIGS = {
@@ -105,10 +139,17 @@ Example format:
 
 class AgentResponse:
     def __init__(self):
-        self.response_lock = asyncio.Lock()
         self.current_task = None
         self.current_language = 'en'  # Default to English
         
+        # Coalesce identical concurrent requests onto one upstream call
+        self.completion_flight = SingleFlight('completion', max_waiters=SINGLE_FLIGHT_MAX_WAITERS)
+        self.tts_flight = SingleFlight('tts', max_waiters=SINGLE_FLIGHT_MAX_WAITERS)
+        self.tts_latency = LatencyTracker()
+        self.tts_hedge_budget = HedgeBudget(TTS_HEDGE_MAX_RATE)
+        self.model_router = ModelRouter()
+        self.audio_store = AudioStore(ttl=AUDIO_STORE_TTL_S, max_bytes=AUDIO_STORE_MAX_BYTES)
+        
         # Initialize OpenAI client
         self.openai_client = AsyncOpenAI(api_key=OPENAI_API_KEY)
         
@@ -120,7 +161,12 @@ class AgentResponse:
                 aws_access_key_id=AWS_ACCESS_KEY_ID,
                 aws_secret_access_key=AWS_SECRET_ACCESS_KEY,
                 region_name=region,
-                endpoint_url=f'https://s3.{region}.amazonaws.com'
+                endpoint_url=f'https://s3.{region}.amazonaws.com',
+                config=Config(
+                    connect_timeout=S3_UPLOAD_TIMEOUT_S,
+                    read_timeout=S3_UPLOAD_TIMEOUT_S,
+                    retries={'max_attempts': 2}
+                )
             )
             self.bucket_name = AWS_S3_BUCKET_AUDIO
             
@@ -140,57 +186,120 @@ class AgentResponse:
         self.current_language = language_code
         logger.info(f"Language set to: {language_code}")
 
-    async def process_input(self, input_text):
+    async def process_input(self, input_text, language: Optional[str] = None, deadline: Optional[Deadline] = None):
         """Process text input and return response with audio"""
-        async with self.response_lock:
+        language = language or self.current_language
+        deadline = deadline or Deadline(COMPLETION_TIMEOUT_S + AUDIO_TIMEOUT_S)
+        try:
+            # Get language configuration
+            config = LANGUAGE_CONFIGS.get(language, LANGUAGE_CONFIGS['en'])
+            
+            # Identical prompts in flight at the same time share one completion.
+            # The shared call keeps its own stage timeout; each caller only
+            # waits for as long as its own deadline allows.
+            completion_budget = deadline.budget(COMPLETION_TIMEOUT_S)
+            text_response = await asyncio.wait_for(
+                self.completion_flight.do(
+                    (language, normalize_text(input_text)),
+                    lambda: self._create_completion(config, input_text, language, completion_budget)
+                ),
+                completion_budget
+            )
+            logger.info(f"Generated text response: {text_response[:100]}...")
+            
+            # Extract language-specific text for TTS
+            tts_text = self._extract_language_text(text_response, language)
+            logger.info(f"Extracted TTS text: {tts_text[:100]}...")
+            
+            # Always try to generate audio, but never hold the text past the deadline
             try:
-                # Get language configuration
-                config = LANGUAGE_CONFIGS.get(self.current_language, LANGUAGE_CONFIGS['en'])
-                
-                # Generate text response using GPT-4
-                completion = await self.openai_client.chat.completions.create(
-                    model="gpt-4o-mini",
-                    messages=[
-                        {"role": "system", "content": config['instructions']},
-                        {"role": "user", "content": input_text}
-                    ],
-                    temperature=0.7,
-                    max_tokens=700
+                audio_deadline = Deadline(deadline.budget(AUDIO_TIMEOUT_S))
+                audio = await asyncio.wait_for(
+                    self._generate_audio_with_fallback(tts_text, text_response, language, audio_deadline),
+                    audio_deadline.seconds
                 )
-                
-                text_response = completion.choices[0].message.content
-                logger.info(f"Generated text response: {text_response[:100]}...")
-                
-                # Extract language-specific text for TTS
-                tts_text = self._extract_language_text(text_response)
-                logger.info(f"Extracted TTS text: {tts_text[:100]}...")
-                
-                # Always try to generate audio
-                try:
-                    audio_url = await self._generate_audio(tts_text)
-                    if not audio_url:
-                        logger.warning("Failed to generate audio, trying with full response")
-                        audio_url = await self._generate_audio(text_response)
-                except Exception as e:
-                    logger.error(f"Error in audio generation: {str(e)}")
-                    audio_url = None
-                
-                return {
-                    "text": text_response,
-                    "audio_url": audio_url
-                }
-                
+            except asyncio.TimeoutError:
+                logger.warning("Audio not ready within the request deadline, returning text only")
+                audio = None
             except Exception as e:
-                logger.error(f"Error processing input: {str(e)}", exc_info=True)
-                raise
+                logger.error(f"Error in audio generation: {str(e)}")
+                audio = None
+            
+            return {
+                "text": text_response,
+                "audio_url": audio["url"] if audio else None,
+                "audio_delivery": audio["delivery"] if audio else None
+            }
+            
+        except Exception as e:
+            logger.error(f"Error processing input: {str(e)}", exc_info=True)
+            raise
+
+    async def _create_completion(self, config: dict, input_text: str, language: str, budget_s: float) -> str:
+        """Generate the text response with the model and token budget picked by the router"""
+        started = time.monotonic()
+        route = self.model_router.route(language, input_text, budget_s)
+        while True:
+            call_started = time.monotonic()
+            completion = await self.openai_client.chat.completions.create(
+                model=route.model,
+                messages=[
+                    {"role": "system", "content": config['instructions']},
+                    {"role": "user", "content": input_text}
+                ],
+                temperature=route.temperature,
+                max_tokens=route.max_tokens,
+                timeout=COMPLETION_TIMEOUT_S
+            )
+            
+            # Learn the model's speed and the language's reply size from what actually came back
+            choice = completion.choices[0]
+            truncated = choice.finish_reason == 'length'
+            usage = getattr(completion, 'usage', None)
+            if usage and usage.completion_tokens:
+                self.model_router.record(route.model, usage.completion_tokens, time.monotonic() - call_started)
+                self.model_router.record_reply(language, input_text, usage.completion_tokens, truncated)
+            
+            if not truncated:
+                return choice.message.content
+            
+            # Cut off mid-template; retry once with a bigger budget if there's time
+            rate = self.model_router.truncation_rate(language)
+            remaining = budget_s - (time.monotonic() - started)
+            retry = self.model_router.retry_truncated(language, input_text, route, remaining)
+            if retry is None:
+                logger.warning(
+                    f"{language} reply truncated at max_tokens={route.max_tokens} on {route.model} "
+                    f"({rate:.0%} of recent {language} replies), returning it as is"
+                )
+                return choice.message.content
+            logger.warning(
+                f"{language} reply truncated at max_tokens={route.max_tokens} "
+                f"({rate:.0%} of recent {language} replies), retrying with {retry.max_tokens}"
+            )
+            route = retry
+
+    async def _generate_audio_with_fallback(self, tts_text: str, text_response: str, language: str,
+                                            deadline: Deadline) -> Optional[dict]:
+        """Generate audio for the extracted text, falling back to the full response"""
+        audio = await self._generate_audio(tts_text, language)
+        if not audio:
+            # A second attempt that can't finish before the deadline only adds load
+            if deadline.remaining() < TTS_TIMEOUT_S:
+                logger.warning("Failed to generate audio, no time left to retry with full response")
+                return None
+            logger.warning("Failed to generate audio, trying with full response")
+            audio = await self._generate_audio(text_response, language)
+        return audio
 
-    def _extract_language_text(self, text_response: str) -> str:
+    def _extract_language_text(self, text_response: str, language: Optional[str] = None) -> str:
         """Extract language-specific text for TTS based on the current language"""
+        language = language or self.current_language
         lines = text_response.split('\n')
         tts_text = []
         
         # For English, use the conversational response part (before any corrections)
-        if self.current_language == 'en':
+        if language == 'en':
             # Take text until we hit a line with an emoji
             for line in lines:
                 if any(emoji in line for emoji in ['💡', '❓', '🌍']):
@@ -199,7 +308,7 @@ class AgentResponse:
                     tts_text.append(line.strip())
         
         # For German, extract German text (before English translations)
-        elif self.current_language == 'de':
+        elif language == 'de':
             for line in lines:
                 if line.startswith('🇩🇪'):
                     # Get text between 🇩🇪 and 🇺🇸 if present
@@ -215,7 +324,7 @@ class AgentResponse:
                     tts_text.append(question.strip())
         
         # For Chinese, extract Chinese characters
-        elif self.current_language == 'zh':
+        elif language == 'zh':
             for line in lines:
                 if line.startswith('🇨🇳'):
                     # Get text between 🇨🇳 and 📝 (before pinyin)
@@ -231,7 +340,7 @@ class AgentResponse:
                     tts_text.append(question.strip())
         
         # For Norwegian, extract Norwegian text
-        elif self.current_language == 'no':
+        elif language == 'no':
             for line in lines:
                 if line.startswith('🇳🇴'):
                     # Get text between 🇳🇴 and 🇺🇸
@@ -247,7 +356,7 @@ class AgentResponse:
                     tts_text.append(question.strip())
         
         # For Brazilian Portuguese, extract Portuguese text
-        elif self.current_language == 'pt-BR':
+        elif language == 'pt-BR':
             for line in lines:
                 if line.startswith('🇧🇷'):
                     # Get text between 🇧🇷 and 🇺🇸
@@ -264,42 +373,43 @@ class AgentResponse:
         
         # Join all extracted text with proper spacing
         combined_text = ' '.join(tts_text).strip()
-        logger.info(f"Extracted text for TTS ({self.current_language}): {combined_text[:100]}...")
+        logger.info(f"Extracted text for TTS ({language}): {combined_text[:100]}...")
         
         return combined_text if combined_text else text_response
 
-    async def _generate_audio(self, text: str) -> Optional[str]:
-        """Generate audio from text and upload to S3"""
-        try:
-            if not text.strip():
-                logger.error("Empty text provided for audio generation")
-                return None
+    async def _generate_audio(self, text: str, language: Optional[str] = None) -> Optional[dict]:
+        """Generate audio from text, returning its url and how it is delivered"""
+        language = language or self.current_language
+        if not text.strip():
+            logger.error("Empty text provided for audio generation")
+            return None
+
+        # Select voice based on language
+        voice = {
+            'en': 'shimmer',  # Female voice for English
+            'de': 'onyx',     # Male voice for German
+            'zh': 'nova',     # Female voice for Chinese
+            'no': 'echo',     # Female voice for Norwegian
+            'pt-BR': 'alloy'  # Neural voice for Portuguese
+        }.get(language, 'shimmer')  # Default to shimmer
 
-            # Select voice based on language
-            voice = {
-                'en': 'shimmer',  # Female voice for English
-                'de': 'onyx',     # Male voice for German
-                'zh': 'nova',     # Female voice for Chinese
-                'no': 'echo',     # Female voice for Norwegian
-                'pt-BR': 'alloy'  # Neural voice for Portuguese
-            }.get(self.current_language, 'shimmer')  # Default to shimmer
+        # Concurrent requests for the same clip share one synthesis and upload
+        return await self.tts_flight.do(
+            (voice, text.strip()),
+            lambda: self._synthesize_and_upload(text, voice, language)
+        )
 
-            logger.info(f"Generating audio with voice {voice} for language {self.current_language}")
+    async def _synthesize_and_upload(self, text: str, voice: str, language: str) -> Optional[dict]:
+        """Run TTS for text and deliver the clip inline, from memory or via S3"""
+        try:
+            logger.info(f"Generating audio with voice {voice} for language {language}")
             logger.info(f"Text to convert: {text[:100]}...")
             
             # Generate audio using OpenAI
             logger.info("Calling OpenAI TTS API...")
-            response = await self.openai_client.audio.speech.create(
-                model="tts-1",
-                voice=voice,
-                input=text
-            )
+            response = await self._create_speech(text, voice)
             logger.info(f"OpenAI TTS response type: {type(response)}")
             
-            if not self.s3_client:
-                logger.error("S3 client is not initialized")
-                return None
-                
             # Create a buffer for the audio
             audio_buffer = io.BytesIO()
             
@@ -323,6 +433,16 @@ class AgentResponse:
                 logger.error("Audio buffer is empty")
                 return None
             
+            # Short clips skip the S3 round trip entirely
+            if AUDIO_DELIVERY_MODE != 's3' and buffer_size <= AUDIO_LOCAL_MAX_BYTES:
+                local_audio = self._deliver_locally(audio_buffer.getvalue())
+                if local_audio:
+                    return local_audio
+            
+            if not self.s3_client:
+                logger.error("S3 client is not initialized")
+                return None
+            
             # Generate unique filename
             timestamp = int(time.time())
             random_string = ''.join(random.choices('abcdefghijklmnopqrstuvwxyz0123456789', k=6))
@@ -332,18 +452,23 @@ class AgentResponse:
             # Upload to S3
             try:
                 logger.info("Uploading to S3...")
-                self.s3_client.upload_fileobj(
-                    audio_buffer,
-                    self.bucket_name,
-                    f"audio/{audio_filename}",
-                    ExtraArgs={
-                        'ContentType': 'audio/mpeg',
-                        'CacheControl': 'max-age=3600',
-                        'Metadata': {
-                            'language': self.current_language,
-                            'timestamp': str(timestamp)
+                # boto3 is blocking; keep it off the event loop and bound its time
+                await asyncio.wait_for(
+                    asyncio.to_thread(
+                        self.s3_client.upload_fileobj,
+                        audio_buffer,
+                        self.bucket_name,
+                        f"audio/{audio_filename}",
+                        ExtraArgs={
+                            'ContentType': 'audio/mpeg',
+                            'CacheControl': 'max-age=3600',
+                            'Metadata': {
+                                'language': language,
+                                'timestamp': str(timestamp)
+                            }
                         }
-                    }
+                    ),
+                    S3_UPLOAD_TIMEOUT_S
                 )
                 
                 # Generate URL
@@ -351,7 +476,10 @@ class AgentResponse:
                 audio_url = f"https://{self.bucket_name}.s3.{region}.amazonaws.com/audio/{audio_filename}"
                 logger.info(f"Successfully uploaded audio to S3: {audio_url}")
                 
-                return audio_url
+                return {"url": audio_url, "delivery": "s3"}
+            except asyncio.TimeoutError:
+                logger.error(f"S3 upload timed out after {S3_UPLOAD_TIMEOUT_S}s")
+                return None
             except Exception as e:
                 logger.error(f"Error uploading to S3: {str(e)}")
                 return None
@@ -360,6 +488,73 @@ class AgentResponse:
             logger.error(f"Error generating audio: {str(e)}", exc_info=True)
             return None
 
+    def _deliver_locally(self, audio_bytes: bytes) -> Optional[dict]:
+        """Return a small clip as a data URL or from the in-memory store"""
+        if AUDIO_DELIVERY_MODE == 'inline':
+            encoded = base64.b64encode(audio_bytes).decode('ascii')
+            logger.info(f"Returning {len(audio_bytes)} byte clip inline")
+            return {"url": f"data:audio/mpeg;base64,{encoded}", "delivery": "inline"}
+        
+        if AUDIO_DELIVERY_MODE == 'memory':
+            clip_id = self.audio_store.put(audio_bytes, 'audio/mpeg')
+            if clip_id:
+                logger.info(f"Stored {len(audio_bytes)} byte clip in memory as {clip_id}")
+                # Made absolute per request by the /chat handler
+                return {"url": f"/audio/{clip_id}", "delivery": "memory"}
+        
+        return None
+
+    async def _create_speech(self, text: str, voice: str):
+        """Call the TTS API, hedging with a second request if the first is slow"""
+        if not TTS_HEDGE_ENABLED:
+            return await self._timed_speech(text, voice)
+
+        hedge_delay = self.tts_latency.percentile(0.95) or TTS_HEDGE_DEFAULT_DELAY_S
+        self.tts_hedge_budget.on_request()
+        # The hedge is the retry; SDK retries would only resend behind its back
+        client = self.openai_client.with_options(max_retries=0)
+        started = time.monotonic()
+        primary = asyncio.create_task(self._timed_speech(text, voice, client))
+        tasks = {primary}
+        try:
+            done, _ = await asyncio.wait(tasks, timeout=hedge_delay)
+            if not done:
+                if self.tts_hedge_budget.try_hedge():
+                    logger.info(f"TTS slower than {hedge_delay:.2f}s, sending hedged request")
+                    tasks.add(asyncio.create_task(self._timed_speech(text, voice, client)))
+                else:
+                    logger.info(f"TTS slower than {hedge_delay:.2f}s, hedge budget spent")
+
+            # Use whichever request succeeds first
+            pending = set(tasks)
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        return task.result()
+            raise primary.exception()
+        finally:
+            if not primary.done():
+                # A primary that lost to its hedge is still a slow sample; record
+                # it up to now so the hedge delay doesn't drift down
+                self.tts_latency.record(time.monotonic() - started)
+            for task in tasks:
+                if not task.done():
+                    task.cancel()
+
+    async def _timed_speech(self, text: str, voice: str, client: Optional[AsyncOpenAI] = None):
+        """Single TTS request, recording its latency for the hedge delay"""
+        client = client or self.openai_client
+        started = time.monotonic()
+        response = await client.audio.speech.create(
+            model="tts-1",
+            voice=voice,
+            input=text,
+            timeout=TTS_TIMEOUT_S
+        )
+        self.tts_latency.record(time.monotonic() - started)
+        return response
+
     async def cleanup_old_audio_files(self):
         """Clean up audio files older than 24 hours"""
         if not self.s3_client:
@@ -0,0 +1,104 @@
+import logging
+import secrets
+import time
+from collections import OrderedDict
+from typing import Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+class AudioClip:
+    def __init__(self, data: bytes, content_type: str, expires_at: float):
+        self.data = data
+        self.content_type = content_type
+        self.expires_at = expires_at
+
+
+class AudioStore:
+    """Bounded in-memory store for short-lived audio clips.
+
+    Entries expire after ttl seconds and the oldest entries are evicted once
+    either max_entries or max_bytes would be exceeded. The store is local to
+    the process, so it only works when /audio requests reach the same worker.
+    """
+
+    def __init__(self, ttl: float = 300, max_entries: int = 1000, max_bytes: int = 64 * 1024 * 1024):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.total_bytes = 0
+        self._clips: "OrderedDict[str, AudioClip]" = OrderedDict()
+
+    def put(self, data: bytes, content_type: str = 'audio/mpeg') -> Optional[str]:
+        """Store a clip and return its id, or None if it can never fit"""
+        if len(data) > self.max_bytes:
+            return None
+        self._expire()
+        while self._clips and (
+            len(self._clips) >= self.max_entries or self.total_bytes + len(data) > self.max_bytes
+        ):
+            _, evicted = self._clips.popitem(last=False)
+            self.total_bytes -= len(evicted.data)
+
+        clip_id = secrets.token_urlsafe(16)
+        self._clips[clip_id] = AudioClip(data, content_type, time.monotonic() + self.ttl)
+        self.total_bytes += len(data)
+        return clip_id
+
+    def get(self, clip_id: str) -> Optional[AudioClip]:
+        clip = self._clips.get(clip_id)
+        if clip is None:
+            return None
+        if clip.expires_at <= time.monotonic():
+            self._remove(clip_id)
+            return None
+        return clip
+
+    def _expire(self) -> None:
+        now = time.monotonic()
+        # Entries are inserted in expiry order, so stop at the first live one
+        while self._clips:
+            clip_id, clip = next(iter(self._clips.items()))
+            if clip.expires_at > now:
+                break
+            self._remove(clip_id)
+
+    def _remove(self, clip_id: str) -> None:
+        clip = self._clips.pop(clip_id, None)
+        if clip is not None:
+            self.total_bytes -= len(clip.data)
+
+
+def parse_range(header: Optional[str], size: int) -> Optional[Tuple[int, int]]:
+    """Parse a single-range Range header into an inclusive (start, end).
+
+    Returns None when the whole body should be sent (no header, a malformed
+    header such as a last byte before the first, or a form we don't serve
+    such as multiple ranges) and raises ValueError when the range cannot be
+    satisfied.
+    """
+    if not header or not header.startswith('bytes=') or ',' in header:
+        return None
+    start_text, _, end_text = header[len('bytes='):].strip().partition('-')
+    try:
+        if start_text:
+            start = int(start_text)
+            end = int(end_text) if end_text else size - 1
+            if start < 0 or (end_text and end < start):
+                # RFC 9110 treats last-pos < first-pos as invalid, not unsatisfiable
+                return None
+        else:
+            # Suffix range: the last N bytes
+            suffix = int(end_text)
+            if suffix < 0:
+                return None
+            start = max(0, size - suffix)
+            end = size - 1
+    except ValueError:
+        # Servers must ignore a Range header they can't parse
+        return None
+
+    end = min(end, size - 1)
+    if start >= size or start > end:
+        raise ValueError(f"Range not satisfiable: {header}")
+    return start, end
@@ -0,0 +1,79 @@
+import asyncio
+import time
+from collections import deque
+from typing import Optional
+
+
+class DeadlineExceeded(asyncio.TimeoutError):
+    """Raised when a request has no time left for the next stage"""
+
+
+class Deadline:
+    """Request-level time budget carried through every stage of a request.
+
+    Each stage asks for budget(stage_timeout), which is the stage's own limit
+    clipped to whatever is left of the overall deadline.
+    """
+
+    def __init__(self, seconds: float):
+        self.seconds = seconds
+        self.expires_at = time.monotonic() + seconds
+
+    def remaining(self) -> float:
+        return max(0.0, self.expires_at - time.monotonic())
+
+    @property
+    def expired(self) -> bool:
+        return self.remaining() <= 0
+
+    def budget(self, stage_timeout: float) -> float:
+        """Time allowed for the next stage, or DeadlineExceeded if none is left"""
+        remaining = self.remaining()
+        if remaining <= 0:
+            raise DeadlineExceeded(f"Request deadline of {self.seconds}s exceeded")
+        return min(stage_timeout, remaining)
+
+
+class LatencyTracker:
+    """Rolling window of observed latencies for percentile estimates"""
+
+    def __init__(self, window: int = 200, min_samples: int = 20):
+        self.samples = deque(maxlen=window)
+        self.min_samples = min_samples
+
+    def record(self, seconds: float) -> None:
+        self.samples.append(seconds)
+
+    def percentile(self, p: float) -> Optional[float]:
+        """Return the p-th percentile (0-1), or None until enough samples exist"""
+        if len(self.samples) < self.min_samples:
+            return None
+        ordered = sorted(self.samples)
+        index = min(len(ordered) - 1, int(p * len(ordered)))
+        return ordered[index]
+
+
+class HedgeBudget:
+    """Caps hedged requests at max_rate of all requests.
+
+    Every request earns max_rate of a token and every hedge spends a whole
+    one, with at most burst tokens saved up for quiet periods.
+    """
+
+    def __init__(self, max_rate: float, burst: float = 5.0):
+        self.max_rate = max_rate
+        self.burst = burst
+        self.tokens = burst
+        self.hedged = 0
+        self.denied = 0
+
+    def on_request(self) -> None:
+        self.tokens = min(self.burst, self.tokens + self.max_rate)
+
+    def try_hedge(self) -> bool:
+        if self.tokens < 1:
+            self.denied += 1
+            return False
+        self.tokens -= 1
+        self.hedged += 1
+        return True
@@ -0,0 +1,219 @@
+import asyncio
+import gc
+import hmac
+import logging
+import os
+import sys
+import threading
+import time
+import tracemalloc
+import weakref
+from collections import Counter
+from typing import Callable, Dict, Optional
+
+from fastapi import APIRouter, Depends, Header, HTTPException
+from fastapi.responses import PlainTextResponse
+
+logger = logging.getLogger(__name__)
+
+# Debug endpoints are only mounted when a token is configured
+DEBUG_ENDPOINTS_TOKEN = os.getenv('DEBUG_ENDPOINTS_TOKEN', '')
+PROFILE_MAX_SECONDS = float(os.getenv('PROFILE_MAX_SECONDS', '60'))
+
+
+class SamplingProfiler:
+    """Samples a thread's Python stack on a background thread.
+
+    Output is in collapsed-stack format ("frame;frame;frame count" per line),
+    which flamegraph.pl, speedscope and inferno read directly.
+    """
+
+    def __init__(self, thread_id: int, interval: float = 0.005):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.samples = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="sampling-profiler", daemon=True)
+
+    def start(self) -> None:
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        self._thread.join()
+
+    def collapsed(self) -> str:
+        return '\n'.join(f"{stack} {count}" for stack, count in self.samples.most_common())
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None:
+                continue
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                frame = frame.f_back
+            self.samples[';'.join(reversed(stack))] += 1
+
+
+class RoomTracker:
+    """Weak references to the objects behind each LiveKit room.
+
+    Rooms stay listed for as long as any of their objects is still alive, so
+    a room that ended but still shows up here is holding on to memory.
+    Tracking is a no-op unless the debug endpoints are enabled.
+    """
+
+    def __init__(self, enabled: bool = bool(DEBUG_ENDPOINTS_TOKEN), max_rooms: int = 10000):
+        self.enabled = enabled
+        self.max_rooms = max_rooms
+        self._rooms: Dict[str, Dict[str, weakref.ref]] = {}
+
+    def track(self, room_name: str, **objects) -> None:
+        if not self.enabled:
+            return
+        refs = self._rooms.setdefault(room_name, {})
+        for name, obj in objects.items():
+            try:
+                refs[name] = weakref.ref(obj)
+            except TypeError:
+                continue
+        if len(self._rooms) > self.max_rooms:
+            self._prune()
+
+    def snapshot(self, active_agents: dict) -> list:
+        self._prune()
+        rooms = []
+        for room_name in sorted(set(self._rooms) | set(active_agents)):
+            refs = self._rooms.get(room_name, {})
+            live = {name: ref() for name, ref in refs.items() if ref() is not None}
+            task = active_agents.get(room_name)
+            http_session = live.get('http_session')
+            model = live.get('model')
+            active = room_name in active_agents
+            rooms.append({
+                "room": room_name,
+                "active": active,
+                # A room is reserved with no task until its agent has started
+                "task": "starting" if active and task is None else _task_state(task),
+                "live_objects": sorted(live),
+                "room_handlers": _handler_count(live.get('room')),
+                "agent_handlers": _handler_count(live.get('agent')),
+                "http_session_open": None if http_session is None else not http_session.closed,
+                "realtime_sessions": None if model is None else len(getattr(model, 'sessions', [])),
+            })
+        return rooms
+
+    def _prune(self) -> None:
+        for room_name in list(self._rooms):
+            if all(ref() is None for ref in self._rooms[room_name].values()):
+                del self._rooms[room_name]
+
+
+def _task_state(task: Optional[asyncio.Task]) -> Optional[str]:
+    if task is None:
+        return None
+    if task.cancelled():
+        return "cancelled"
+    return "done" if task.done() else "running"
+
+
+def _handler_count(emitter) -> Optional[int]:
+    # Both livekit.rtc and livekit.agents emitters keep handlers in _events
+    events = getattr(emitter, '_events', None)
+    if events is None:
+        return None
+    return sum(len(handlers) for handlers in events.values())
+
+
+def _count_open_client_sessions() -> int:
+    import aiohttp
+    return sum(
+        1 for obj in gc.get_objects()
+        if isinstance(obj, aiohttp.ClientSession) and not obj.closed
+    )
+
+
+def create_debug_router(
+    active_agents: dict,
+    room_tracker: RoomTracker,
+    extra_stats: Callable[[], dict] = dict,
+    token: str = DEBUG_ENDPOINTS_TOKEN,
+) -> APIRouter:
+    """Routes for on-demand profiling and memory diagnostics, guarded by token"""
+
+    def require_token(x_debug_token: str = Header(default='')):
+        if not hmac.compare_digest(x_debug_token.encode(), token.encode()):
+            raise HTTPException(status_code=403, detail="Invalid debug token")
+
+    router = APIRouter(prefix="/debug", dependencies=[Depends(require_token)])
+    state = {"profiling": False, "baseline": None}
+
+    @router.post("/profile", response_class=PlainTextResponse)
+    async def profile(seconds: float = 10, interval_ms: float = 5):
+        if state["profiling"]:
+            raise HTTPException(status_code=409, detail="A profile is already running")
+        seconds = min(max(seconds, 0.1), PROFILE_MAX_SECONDS)
+        state["profiling"] = True
+        # Sample the event loop thread, i.e. the thread running this handler
+        profiler = SamplingProfiler(threading.get_ident(), interval=max(interval_ms, 1) / 1000)
+        try:
+            logger.info(f"Profiling event loop for {seconds}s")
+            profiler.start()
+            await asyncio.sleep(seconds)
+        finally:
+            profiler.stop()
+            state["profiling"] = False
+        return profiler.collapsed()
+
+    @router.post("/tracemalloc/start")
+    async def tracemalloc_start(frames: int = 25):
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(frames)
+        state["baseline"] = tracemalloc.take_snapshot()
+        return {"tracing": True, "frames": tracemalloc.get_traceback_limit()}
+
+    @router.post("/tracemalloc/stop")
+    async def tracemalloc_stop():
+        tracemalloc.stop()
+        state["baseline"] = None
+        return {"tracing": False}
+
+    @router.get("/tracemalloc/snapshot")
+    async def tracemalloc_snapshot(limit: int = 25, group_by: str = "lineno"):
+        if not tracemalloc.is_tracing():
+            raise HTTPException(status_code=409, detail="tracemalloc is not running")
+        snapshot = tracemalloc.take_snapshot()
+        current, peak = tracemalloc.get_traced_memory()
+        return {
+            "current_bytes": current,
+            "peak_bytes": peak,
+            "top": [str(stat) for stat in snapshot.statistics(group_by)[:limit]],
+        }
+
+    @router.get("/tracemalloc/diff")
+    async def tracemalloc_diff(limit: int = 25, group_by: str = "lineno", rebase: bool = False):
+        if not tracemalloc.is_tracing() or state["baseline"] is None:
+            raise HTTPException(status_code=409, detail="tracemalloc is not running")
+        snapshot = tracemalloc.take_snapshot()
+        diff = snapshot.compare_to(state["baseline"], group_by)
+        if rebase:
+            state["baseline"] = snapshot
+        return {"top": [str(stat) for stat in diff[:limit]]}
+
+    @router.get("/rooms")
+    async def rooms(count_sessions: bool = False):
+        result = {
+            "at": time.time(),
+            "asyncio_tasks": len(asyncio.all_tasks()),
+            "rooms": room_tracker.snapshot(active_agents),
+            **extra_stats(),
+        }
+        if count_sessions:
+            # Walks the whole heap, so only on request
+            result["open_client_sessions"] = _count_open_client_sessions()
+        return result
+
+    return router
@@ -0,0 +1,235 @@
+import logging
+import os
+import time
+from collections import deque
+from typing import Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# Candidate models in order of preference; later ones are used when the
+# earlier ones are observed to be too slow for the SLO
+CHAT_MODELS = [
+    model.strip() for model in os.getenv('CHAT_MODELS', 'gpt-4o-mini,gpt-4.1-nano').split(',') if model.strip()
+]
+CHAT_LATENCY_SLO_S = float(os.getenv('CHAT_LATENCY_SLO_S', '8'))
+CHAT_MAX_TOKENS = int(os.getenv('CHAT_MAX_TOKENS', '700'))
+CHAT_MIN_TOKENS = int(os.getenv('CHAT_MIN_TOKENS', '120'))
+CHAT_TEMPERATURE = float(os.getenv('CHAT_TEMPERATURE', '0.7'))
+
+# Starting guesses until we have observed a model
+DEFAULT_TOKENS_PER_S = 60.0
+DEFAULT_OVERHEAD_S = 0.6
+
+# Reply budgets are learned per language from usage.completion_tokens: the
+# given percentile of recent replies (beyond the part that echoes the input),
+# plus headroom. Until a language has enough replies it gets CHAT_MAX_TOKENS.
+REPLY_SIZE_PERCENTILE = float(os.getenv('CHAT_REPLY_SIZE_PERCENTILE', '0.9'))
+REPLY_SIZE_HEADROOM = float(os.getenv('CHAT_REPLY_SIZE_HEADROOM', '1.25'))
+REPLY_SIZE_MIN_SAMPLES = int(os.getenv('CHAT_REPLY_SIZE_MIN_SAMPLES', '10'))
+
+
+class RouteDecision:
+    def __init__(self, model: str, max_tokens: int, temperature: float, estimated_s: float, reason: str):
+        self.model = model
+        self.max_tokens = max_tokens
+        self.temperature = temperature
+        self.estimated_s = estimated_s
+        self.reason = reason
+
+    def to_dict(self) -> dict:
+        return {
+            "model": self.model,
+            "max_tokens": self.max_tokens,
+            "temperature": self.temperature,
+            "estimated_s": round(self.estimated_s, 3),
+            "reason": self.reason,
+        }
+
+
+class ModelStats:
+    """Moving average of a model's generation speed"""
+
+    def __init__(self, alpha: float = 0.2):
+        self.alpha = alpha
+        self.seconds_per_token = 1 / DEFAULT_TOKENS_PER_S
+        self.samples = 0
+
+    def record(self, completion_tokens: int, elapsed_s: float) -> None:
+        if completion_tokens <= 0:
+            return
+        observed = max(elapsed_s - DEFAULT_OVERHEAD_S, 0.001) / completion_tokens
+        self.seconds_per_token += self.alpha * (observed - self.seconds_per_token)
+        self.samples += 1
+
+    def estimate(self, tokens: int) -> float:
+        return DEFAULT_OVERHEAD_S + tokens * self.seconds_per_token
+
+    def tokens_within(self, seconds: float) -> int:
+        return int(max(seconds - DEFAULT_OVERHEAD_S, 0) / self.seconds_per_token)
+
+
+class ReplySizes:
+    """Rolling window of one language's reply sizes and how many were cut off.
+
+    Sizes are stored net of the input length, since replies repeat the
+    learner's sentence back with corrections. A truncated reply is stored at
+    the size it was cut to, which pulls the next budget up by the headroom.
+    """
+
+    def __init__(self, window: int = 200):
+        self.samples = deque(maxlen=window)
+        self.replies = 0
+        self.truncated = 0
+
+    def record(self, completion_tokens: int, input_tokens: float, truncated: bool) -> None:
+        self.samples.append((max(completion_tokens - input_tokens, 0), truncated))
+        self.replies += 1
+        if truncated:
+            self.truncated += 1
+
+    def percentile(self, p: float, min_samples: int) -> Optional[float]:
+        """Return the p-th percentile (0-1) of reply sizes, or None until enough samples exist"""
+        if len(self.samples) < min_samples:
+            return None
+        ordered = sorted(size for size, _ in self.samples)
+        return ordered[min(len(ordered) - 1, int(p * len(ordered)))]
+
+    def truncation_rate(self) -> float:
+        """Share of the replies in the window that stopped at max_tokens"""
+        if not self.samples:
+            return 0.0
+        return sum(1 for _, truncated in self.samples if truncated) / len(self.samples)
+
+
+class ModelRouter:
+    """Choose model and max_tokens for each chat completion.
+
+    The reply budget is learned per language from recent reply sizes and
+    grows with the input length. It is capped so the predicted generation
+    time stays within the latency SLO (or the request's remaining budget).
+    Generation speed is learned from completed calls.
+    """
+
+    def __init__(
+        self,
+        models: List[str] = CHAT_MODELS,
+        latency_slo: float = CHAT_LATENCY_SLO_S,
+        max_tokens: int = CHAT_MAX_TOKENS,
+        min_tokens: int = CHAT_MIN_TOKENS,
+        temperature: float = CHAT_TEMPERATURE,
+        reply_percentile: float = REPLY_SIZE_PERCENTILE,
+        reply_headroom: float = REPLY_SIZE_HEADROOM,
+        reply_min_samples: int = REPLY_SIZE_MIN_SAMPLES,
+    ):
+        self.models = models
+        self.latency_slo = latency_slo
+        self.max_tokens = max_tokens
+        self.min_tokens = min_tokens
+        self.temperature = temperature
+        self.reply_percentile = reply_percentile
+        self.reply_headroom = reply_headroom
+        self.reply_min_samples = reply_min_samples
+        self.stats: Dict[str, ModelStats] = {model: ModelStats() for model in models}
+        self.reply_sizes: Dict[str, ReplySizes] = {}
+        self.decisions = deque(maxlen=200)
+
+    def reply_budget(self, language: str, input_tokens: float) -> int:
+        """max_tokens that should fit a full reply, before any SLO cap"""
+        sizes = self.reply_sizes.get(language)
+        typical = sizes.percentile(self.reply_percentile, self.reply_min_samples) if sizes else None
+        if typical is None:
+            return self.max_tokens
+        wanted = int((typical + input_tokens) * self.reply_headroom)
+        return max(self.min_tokens, min(self.max_tokens, wanted))
+
+    def route(self, language: str, input_text: str, budget_s: Optional[float] = None) -> RouteDecision:
+        input_tokens = _estimate_tokens(input_text)
+        floor = min(self.max_tokens, self.min_tokens)
+        wanted = self.reply_budget(language, input_tokens)
+
+        target_s = min(self.latency_slo, budget_s) if budget_s else self.latency_slo
+
+        # Prefer the first model that can produce the full reply within the target
+        fastest = None
+        for model in self.models:
+            stats = self.stats[model]
+            if stats.estimate(wanted) <= target_s:
+                decision = RouteDecision(model, wanted, self.temperature, stats.estimate(wanted), "fits_slo")
+                return self._record(language, input_tokens, decision)
+            if fastest is None or stats.tokens_within(target_s) > self.stats[fastest].tokens_within(target_s):
+                fastest = model
+
+        # Nothing fits; take the fastest model and trim the reply to the target
+        stats = self.stats[fastest]
+        tokens = max(floor, min(wanted, stats.tokens_within(target_s)))
+        decision = RouteDecision(fastest, tokens, self.temperature, stats.estimate(tokens), "capped_by_slo")
+        return self._record(language, input_tokens, decision)
+
+    def retry_truncated(
+        self, language: str, input_text: str, decision: RouteDecision, remaining_s: float
+    ) -> Optional[RouteDecision]:
+        """A reply stopped at max_tokens; return a larger budget to retry with.
+
+        Returns None when this was already the retry, the budget can't grow or
+        a retry wouldn't finish in remaining_s; the truncated reply is then
+        used as is.
+        """
+        if decision.reason == "retry_truncated":
+            return None
+        stats = self.stats.setdefault(decision.model, ModelStats())
+        tokens = min(self.max_tokens, decision.max_tokens * 2)
+        if tokens <= decision.max_tokens or stats.estimate(tokens) > remaining_s:
+            return None
+        retry = RouteDecision(decision.model, tokens, decision.temperature, stats.estimate(tokens), "retry_truncated")
+        return self._record(language, _estimate_tokens(input_text), retry)
+
+    def record(self, model: str, completion_tokens: int, elapsed_s: float) -> None:
+        """Feed back the speed of a completion"""
+        self.stats.setdefault(model, ModelStats()).record(completion_tokens, elapsed_s)
+
+    def record_reply(self, language: str, input_text: str, completion_tokens: int, truncated: bool) -> None:
+        """Feed back a reply's size and whether it stopped at max_tokens"""
+        sizes = self.reply_sizes.setdefault(language, ReplySizes())
+        sizes.record(completion_tokens, _estimate_tokens(input_text), truncated)
+
+    def truncation_rate(self, language: str) -> float:
+        sizes = self.reply_sizes.get(language)
+        return sizes.truncation_rate() if sizes else 0.0
+
+    def recent_decisions(self) -> list:
+        return list(self.decisions)
+
+    def snapshot(self, limit: int = 20) -> dict:
+        """Learned model speeds, reply sizes and the latest decisions, for the debug endpoints"""
+        return {
+            "models": {
+                model: {"tokens_per_s": round(1 / stats.seconds_per_token, 1), "samples": stats.samples}
+                for model, stats in self.stats.items()
+            },
+            "languages": {
+                language: {
+                    "replies": sizes.replies,
+                    "truncated": sizes.truncated,
+                    "truncation_rate": round(sizes.truncation_rate(), 3),
+                    "reply_tokens": sizes.percentile(self.reply_percentile, self.reply_min_samples),
+                    "max_tokens": self.reply_budget(language, 0),
+                }
+                for language, sizes in self.reply_sizes.items()
+            },
+            "recent_decisions": self.recent_decisions()[-limit:],
+        }
+
+    def _record(self, language: str, input_tokens: float, decision: RouteDecision) -> RouteDecision:
+        entry = decision.to_dict()
+        entry.update({"language": language, "input_tokens": int(input_tokens), "at": time.time()})
+        self.decisions.append(entry)
+        logger.info(
+            f"Routed chat to {decision.model} with max_tokens={decision.max_tokens} "
+            f"({decision.reason}, est {decision.estimated_s:.2f}s)"
+        )
+        return decision
+
+
+def _estimate_tokens(text: str) -> float:
+    # ~4 bytes per token holds up reasonably for both Latin and CJK text
+    return len(text.encode('utf-8')) / 4
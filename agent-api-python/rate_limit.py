@@ -0,0 +1,210 @@
+import asyncio
+import hashlib
+import hmac
+import logging
+import math
+import os
+import time
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# 'memory' buckets are per worker process, so with N workers a caller gets up
+# to N times their quota; use 'redis' to share them across workers and replicas
+RATE_LIMIT_BACKEND = os.getenv('RATE_LIMIT_BACKEND', 'memory').lower()
+REDIS_URL = os.getenv('REDIS_URL', '')
+# Proxies/load balancers in front of this API that append to X-Forwarded-For;
+# 0 when clients connect directly. Unset means unknown: the peer may be a
+# shared proxy, so client addresses are not used as quota keys at all.
+TRUSTED_PROXY_HOPS = int(os.environ['TRUSTED_PROXY_HOPS']) if os.getenv('TRUSTED_PROXY_HOPS') else None
+# Shared with the web app, which signs short-lived caller tokens for signed-in users
+CALLER_TOKEN_SECRET = os.getenv('CALLER_TOKEN_SECRET', '')
+
+INTERACTIVE = 'interactive'
+BACKGROUND = 'background'
+
+
+class MemoryRateLimitBackend:
+    """Token buckets held in this process, least recently used evicted first"""
+
+    blocking = False
+
+    def __init__(self, max_keys: int = 100000):
+        self.max_keys = max_keys
+        self._buckets: "OrderedDict[str, Tuple[float, float]]" = OrderedDict()
+
+    def take(self, key: str, rate: float, burst: float) -> float:
+        """Take one token; return 0 if allowed, else seconds until one is available"""
+        now = time.monotonic()
+        tokens, updated = self._buckets.pop(key, (burst, now))
+        tokens = min(burst, tokens + (now - updated) * rate)
+        if tokens >= 1:
+            tokens -= 1
+            wait = 0.0
+        else:
+            wait = (1 - tokens) / rate
+        self._buckets[key] = (tokens, now)
+        if len(self._buckets) > self.max_keys:
+            # An evicted key starts again with a full bucket, so eviction only errs lenient
+            self._buckets.popitem(last=False)
+        return wait
+
+
+_TOKEN_BUCKET_SCRIPT = """
+local rate = tonumber(ARGV[1])
+local burst = tonumber(ARGV[2])
+local now = redis.call('time')
+now = tonumber(now[1]) + tonumber(now[2]) / 1000000
+local bucket = redis.call('hmget', KEYS[1], 'tokens', 'updated')
+local tokens = tonumber(bucket[1]) or burst
+local updated = tonumber(bucket[2]) or now
+tokens = math.min(burst, tokens + (now - updated) * rate)
+local wait = 0
+if tokens >= 1 then
+    tokens = tokens - 1
+else
+    wait = (1 - tokens) / rate
+end
+redis.call('hset', KEYS[1], 'tokens', tokens, 'updated', now)
+redis.call('pexpire', KEYS[1], math.ceil(burst / rate * 1000) + 1000)
+return tostring(wait)
+"""
+
+
+class RedisRateLimitBackend:
+    """Token buckets shared by all replicas through a Redis client with eval"""
+
+    blocking = True
+
+    def __init__(self, client, prefix: str = 'laingfy:ratelimit:'):
+        if not hasattr(client, 'eval'):
+            raise ValueError("The shared rate limit backend needs a client that supports eval")
+        self.client = client
+        self.prefix = prefix
+
+    def take(self, key: str, rate: float, burst: float) -> float:
+        return float(self.client.eval(_TOKEN_BUCKET_SCRIPT, 1, f"{self.prefix}{key}", rate, burst))
+
+
+class RateLimiter:
+    """Token bucket limit of `per_minute` requests per key with bursts of `burst`"""
+
+    def __init__(self, name: str, per_minute: float, burst: float, backend):
+        self.name = name
+        self.rate = per_minute / 60
+        self.burst = burst
+        self.backend = backend
+        self.rejected = 0
+
+    async def check(self, key: Optional[str]) -> Optional[float]:
+        """Return None if the request may proceed, else the Retry-After in seconds.
+
+        Callers without a trustworthy identity (key None) are not limited
+        here; sharing one bucket would throttle everyone together.
+        """
+        if self.rate <= 0 or key is None:
+            return None
+        if self.backend.blocking:
+            wait = await asyncio.to_thread(self.backend.take, f"{self.name}:{key}", self.rate, self.burst)
+        else:
+            wait = self.backend.take(f"{self.name}:{key}", self.rate, self.burst)
+        if wait <= 0:
+            return None
+        self.rejected += 1
+        return wait
+
+
+class AdmissionController:
+    """Caps in-flight requests and sheds load early instead of queueing.
+
+    Interactive requests may use every slot; background requests only get
+    background_share of them, so they are the first to be turned away as the
+    server fills up.
+    """
+
+    def __init__(self, max_inflight: int, background_share: float = 0.5):
+        self.max_inflight = max_inflight
+        self.background_limit = int(max_inflight * background_share)
+        self.inflight = 0
+        self.shed: Dict[str, int] = {INTERACTIVE: 0, BACKGROUND: 0}
+
+    def try_acquire(self, priority: str = INTERACTIVE) -> bool:
+        limit = self.max_inflight if priority == INTERACTIVE else self.background_limit
+        if self.max_inflight > 0 and self.inflight >= limit:
+            self.shed[priority] = self.shed.get(priority, 0) + 1
+            return False
+        self.inflight += 1
+        return True
+
+    def release(self) -> None:
+        self.inflight -= 1
+
+    def stats(self) -> dict:
+        return {"inflight": self.inflight, "max_inflight": self.max_inflight, "shed": dict(self.shed)}
+
+
+def verify_caller_token(token: Optional[str], secret: str = CALLER_TOKEN_SECRET, now: Optional[float] = None) -> Optional[str]:
+    """Return the user id from a "<user id>.<expires>.<hex hmac-sha256>" token, or None.
+
+    The web app signs "<user id>.<expires>" with the shared secret for the
+    signed-in user; expired, malformed or forged tokens are ignored.
+    """
+    if not token or not secret:
+        return None
+    try:
+        user_id, expires, signature = token.rsplit('.', 2)
+        expires_at = int(expires)
+    except ValueError:
+        return None
+    expected = hmac.new(secret.encode(), f"{user_id}.{expires}".encode(), hashlib.sha256).hexdigest()
+    if not user_id or not hmac.compare_digest(signature.encode(), expected.encode()):
+        return None
+    if expires_at < (time.time() if now is None else now):
+        return None
+    return user_id
+
+
+def client_address(request, trusted_hops: Optional[int] = TRUSTED_PROXY_HOPS) -> str:
+    """The caller's address, taking X-Forwarded-For only as far as our own proxies wrote it"""
+    peer = request.client.host if request.client else 'unknown'
+    if not trusted_hops or trusted_hops <= 0:
+        return peer
+    forwarded = [hop.strip() for hop in request.headers.get('x-forwarded-for', '').split(',') if hop.strip()]
+    # Each trusted proxy appended the address it saw; entries further left are caller-controlled
+    hops = forwarded + [peer]
+    return hops[max(0, len(hops) - 1 - trusted_hops)]
+
+
+def caller_identity(request) -> Optional[str]:
+    """Key a request by its signed-in user, falling back to the client address.
+
+    Returns None when neither is trustworthy: no valid caller token and
+    TRUSTED_PROXY_HOPS unset, where the peer may be the load balancer.
+    """
+    user_id = verify_caller_token(request.headers.get('x-caller-token'), CALLER_TOKEN_SECRET)
+    if user_id:
+        return f"user:{user_id}"
+    if TRUSTED_PROXY_HOPS is None:
+        return None
+    return f"ip:{client_address(request, TRUSTED_PROXY_HOPS)}"
+
+
+def request_priority(request) -> str:
+    """Clients mark prefetch-style work as background; everything else is interactive"""
+    return BACKGROUND if request.headers.get('x-request-priority') == BACKGROUND else INTERACTIVE
+
+
+def retry_after_header(seconds: float) -> Dict[str, str]:
+    return {"Retry-After": str(max(1, math.ceil(seconds)))}
+
+
+def create_rate_limit_backend(backend: str = RATE_LIMIT_BACKEND):
+    """Build the backend selected by RATE_LIMIT_BACKEND"""
+    if backend == 'redis':
+        if not REDIS_URL:
+            raise ValueError("REDIS_URL is not set")
+        import redis  # Only needed for the redis backend
+        logger.info("Using Redis rate limit backend")
+        return RedisRateLimitBackend(redis.Redis.from_url(REDIS_URL))
+    return MemoryRateLimitBackend()
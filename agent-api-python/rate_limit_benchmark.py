@@ -0,0 +1,69 @@
+"""Microbenchmark for the per-request cost of rate limiting and admission.
+
+Times RateLimiter.check with the in-process backend and an
+AdmissionController acquire/release pair against an empty awaited call,
+across a realistic spread of caller keys.
+
+    python rate_limit_benchmark.py --iterations 200000 --keys 10000
+"""
+import argparse
+import asyncio
+import json
+import random
+import time
+
+from rate_limit import AdmissionController, MemoryRateLimitBackend, RateLimiter
+
+
+async def _noop(key: str):
+    return None
+
+
+async def _time_per_call(fn, keys, iterations: int) -> float:
+    """Mean microseconds per awaited call of fn(key)"""
+    started = time.perf_counter()
+    for i in range(iterations):
+        await fn(keys[i % len(keys)])
+    return (time.perf_counter() - started) / iterations * 1e6
+
+
+async def main(args) -> dict:
+    random.seed(args.seed)
+    keys = [f"user:{random.getrandbits(48):x}" for _ in range(args.keys)]
+    random.shuffle(keys)
+
+    # High limits so every check takes the full "allowed" path
+    limiter = RateLimiter("bench", per_minute=1e9, burst=1e9, backend=MemoryRateLimitBackend())
+    admission = AdmissionController(max_inflight=1000)
+
+    async def admit(key: str):
+        if await limiter.check(key) is None and admission.try_acquire():
+            admission.release()
+
+    # Warm up so every key already has a bucket
+    await _time_per_call(limiter.check, keys, len(keys))
+
+    baseline_us = await _time_per_call(_noop, keys, args.iterations)
+    check_us = await _time_per_call(limiter.check, keys, args.iterations)
+    admit_us = await _time_per_call(admit, keys, args.iterations)
+
+    return {
+        "iterations": args.iterations,
+        "keys": args.keys,
+        "baseline_await_us": round(baseline_us, 3),
+        "rate_limit_check_us": round(check_us, 3),
+        "check_plus_admission_us": round(admit_us, 3),
+        "overhead_vs_baseline_us": round(admit_us - baseline_us, 3),
+    }
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--iterations", type=int, default=200000)
+    parser.add_argument("--keys", type=int, default=10000, help="distinct caller identities")
+    parser.add_argument("--seed", type=int, default=1)
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    print(json.dumps(asyncio.run(main(parse_args())), indent=2))
@@ -0,0 +1,215 @@
+import asyncio
+import logging
+import os
+import time
+from collections import deque
+from typing import Callable, Deque, Dict, Iterable, Optional, Set
+
+import aiohttp
+from livekit.plugins import openai
+
+logger = logging.getLogger(__name__)
+
+REALTIME_POOL_SIZE = int(os.getenv('REALTIME_POOL_SIZE', '1'))
+REALTIME_POOL_IDLE_TTL_S = float(os.getenv('REALTIME_POOL_IDLE_TTL_S', '240'))
+REALTIME_POOL_HEALTH_INTERVAL_S = float(os.getenv('REALTIME_POOL_HEALTH_INTERVAL_S', '10'))
+# Comma separated language names to warm at startup, e.g. "German,Chinese"
+REALTIME_POOL_LANGUAGES = [
+    language.strip() for language in os.getenv('REALTIME_POOL_LANGUAGES', '').split(',') if language.strip()
+]
+
+
+def build_realtime_model(language: str, http_session: aiohttp.ClientSession) -> openai.realtime.RealtimeModel:
+    """Create the realtime model used for a LiveKit language lesson"""
+    return openai.realtime.RealtimeModel(
+        instructions=f"""You are an expert language instructor for {language}. Your teaching style is
+encouraging, patient, and engaging. You should adapt your teaching approach based on
+the student's proficiency level. Use a clear, standard accent that's easily
+understandable for learners. Focus on:
+- Natural conversation practice in {language}
+- Gentle correction of pronunciation and grammar mistakes
+- Introducing relevant vocabulary in context
+- Providing cultural context when appropriate
+- Maintaining a supportive learning environment
+
+Keep interactions conversational while weaving in language learning opportunities.
+If the student makes a mistake, wait for them to finish speaking before offering
+corrections. Praise good usage and progress. Adjust your speaking pace and
+complexity based on the student's demonstrated ability level.""",
+        voice="alloy",
+        temperature=0.8,
+        modalities=["text", "audio"],
+        turn_detection=openai.realtime.ServerVadOptions(
+            threshold=0.5,
+            silence_duration_ms=200,
+            prefix_padding_ms=300,
+        ),
+        http_session=http_session  # Pass the HTTP session to the model
+    )
+
+
+class WarmSession:
+    """A realtime model whose upstream session was opened ahead of time"""
+
+    def __init__(self, language: str, model, http_session: aiohttp.ClientSession):
+        self.language = language
+        self.model = model
+        self.http_session = http_session
+        self.created_at = time.monotonic()
+
+        # Opening the session starts the websocket handshake in the background
+        self.session = model.session()
+        self._attach_to_next_agent()
+
+    def _attach_to_next_agent(self) -> None:
+        # MultimodalAgent.start() asks the model for a new session; hand it the
+        # pre-connected one instead so the learner doesn't wait for a handshake.
+        # This and connected/healthy below lean on livekit-plugins-openai 0.10
+        # internals, which is why requirements.txt pins it.
+        open_session = self.model.session
+
+        def session(**kwargs):
+            del self.model.session
+            if any(value is not None for value in kwargs.values()):
+                return open_session(**kwargs)
+            return self.session
+
+        self.model.session = session
+
+    @property
+    def connected(self) -> bool:
+        return getattr(self.session, '_session_id', 'not-connected') != 'not-connected'
+
+    @property
+    def healthy(self) -> bool:
+        main_task = getattr(self.session, '_main_atask', None)
+        return main_task is None or not main_task.done()
+
+    def idle_for(self) -> float:
+        return time.monotonic() - self.created_at
+
+    async def aclose(self) -> None:
+        try:
+            await self.model.aclose()
+        except Exception as e:
+            logger.error(f"Error closing realtime session: {str(e)}", exc_info=True)
+        if not self.http_session.closed:
+            await self.http_session.close()
+
+
+class RealtimeSessionPool:
+    """Per-language pool of pre-connected realtime sessions.
+
+    Languages are warmed at startup (REALTIME_POOL_LANGUAGES) or after their
+    first use, and topped back up to `size` idle sessions after each acquire.
+    A background task replaces sessions that died or sat idle past idle_ttl.
+    """
+
+    def __init__(
+        self,
+        size: int = REALTIME_POOL_SIZE,
+        idle_ttl: float = REALTIME_POOL_IDLE_TTL_S,
+        health_interval: float = REALTIME_POOL_HEALTH_INTERVAL_S,
+        model_factory: Callable[[str, aiohttp.ClientSession], object] = build_realtime_model,
+    ):
+        self.size = size
+        self.idle_ttl = idle_ttl
+        self.health_interval = health_interval
+        self.model_factory = model_factory
+        self._idle: Dict[str, Deque[WarmSession]] = {}
+        self._languages: Set[str] = set()
+        self._health_task: Optional[asyncio.Task] = None
+        self._closing: Set[asyncio.Task] = set()
+        self.hits = 0
+        self.misses = 0
+
+    def start(self, languages: Iterable[str] = ()) -> None:
+        """Warm the given languages and start health checking"""
+        for language in languages:
+            self._languages.add(language)
+            self._refill(language)
+        if self.size > 0 and self._health_task is None:
+            self._health_task = asyncio.create_task(self._health_loop())
+
+    def acquire(self, language: str) -> WarmSession:
+        """Take a warm session for language, or open a new one if none is ready.
+
+        This never waits: a cold session starts connecting immediately, so the
+        handshake still overlaps with waiting for the participant.
+        """
+        idle = self._idle.setdefault(language, deque())
+        warm = None
+        while idle:
+            candidate = idle.popleft()
+            if candidate.healthy and candidate.idle_for() < self.idle_ttl:
+                warm = candidate
+                break
+            self._close_later(candidate)
+
+        if warm:
+            self.hits += 1
+            logger.info(f"Using pre-warmed realtime session for {language} (connected={warm.connected})")
+        else:
+            self.misses += 1
+            logger.info(f"No warm realtime session for {language}, connecting now")
+            warm = self._open(language)
+
+        self._languages.add(language)
+        self._refill(language)
+        return warm
+
+    def stats(self) -> dict:
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "idle": {language: len(idle) for language, idle in self._idle.items()},
+        }
+
+    async def aclose(self) -> None:
+        if self._health_task:
+            self._health_task.cancel()
+            self._health_task = None
+        for idle in self._idle.values():
+            while idle:
+                self._close_later(idle.popleft())
+        if self._closing:
+            await asyncio.gather(*self._closing, return_exceptions=True)
+
+    def _open(self, language: str) -> WarmSession:
+        http_session = aiohttp.ClientSession()
+        try:
+            return WarmSession(language, self.model_factory(language, http_session), http_session)
+        except Exception:
+            self._close_later_session(http_session)
+            raise
+
+    def _refill(self, language: str) -> None:
+        idle = self._idle.setdefault(language, deque())
+        while len(idle) < self.size:
+            try:
+                idle.append(self._open(language))
+            except Exception as e:
+                logger.error(f"Error pre-warming realtime session for {language}: {str(e)}", exc_info=True)
+                return
+
+    async def _health_loop(self) -> None:
+        while True:
+            await asyncio.sleep(self.health_interval)
+            for language in list(self._languages):
+                idle = self._idle.setdefault(language, deque())
+                for warm in list(idle):
+                    if not warm.healthy or warm.idle_for() >= self.idle_ttl:
+                        logger.info(f"Replacing {'stale' if warm.healthy else 'dead'} realtime session for {language}")
+                        idle.remove(warm)
+                        self._close_later(warm)
+                self._refill(language)
+
+    def _close_later(self, warm: WarmSession) -> None:
+        self._track(asyncio.create_task(warm.aclose()))
+
+    def _close_later_session(self, http_session: aiohttp.ClientSession) -> None:
+        self._track(asyncio.create_task(http_session.close()))
+
+    def _track(self, task: asyncio.Task) -> None:
+        self._closing.add(task)
+        task.add_done_callback(self._closing.discard)
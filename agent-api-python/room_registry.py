@@ -0,0 +1,268 @@
+import asyncio
+import logging
+import os
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+from abc import ABC, abstractmethod
+from contextlib import contextmanager
+from typing import Dict, Iterator, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+ROOM_REGISTRY_BACKEND = os.getenv('ROOM_REGISTRY_BACKEND', 'sqlite').lower()
+ROOM_REGISTRY_PATH = os.getenv('ROOM_REGISTRY_PATH', 'room_registry.db')
+ROOM_LEASE_TTL_S = float(os.getenv('ROOM_LEASE_TTL_S', '30'))
+REDIS_URL = os.getenv('REDIS_URL', '')
+
+# Identifies this replica as the owner of the rooms it runs
+REPLICA_ID = os.getenv('REPLICA_ID') or f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+
+class RoomRegistry(ABC):
+    """Lease-based record of which replica runs the agent for each room.
+
+    A replica must claim a room before starting its agent and keep renewing
+    the lease while the agent runs. If the replica dies, the lease expires and
+    the room can be claimed again. All methods are blocking; call them through
+    asyncio.to_thread from async code.
+    """
+
+    @abstractmethod
+    def claim(self, room: str, owner: str, ttl: float) -> bool:
+        """Atomically take the room if it is free or expired.
+
+        A live lease always wins, even one held by the same owner, so two
+        starts for one room never both succeed.
+        """
+
+    @abstractmethod
+    def renew(self, room: str, owner: str, ttl: float) -> bool:
+        """Extend our lease; False means the lease was lost to another owner"""
+
+    @abstractmethod
+    def release(self, room: str, owner: str) -> None:
+        """Give up the room if we still own it"""
+
+    @abstractmethod
+    def owner_of(self, room: str) -> Optional[str]:
+        """Current owner of the room, or None if it is free"""
+
+
+class SQLiteRoomRegistry(RoomRegistry):
+    """Registry shared by processes on one host through a SQLite file"""
+
+    def __init__(self, path: str = ROOM_REGISTRY_PATH):
+        self.path = path
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS room_leases ("
+                "room TEXT PRIMARY KEY, owner TEXT NOT NULL, expires_at REAL NOT NULL)"
+            )
+
+    @contextmanager
+    def _connect(self) -> Iterator[sqlite3.Connection]:
+        # One short-lived connection per call so it can run on any thread
+        conn = sqlite3.connect(self.path, timeout=5)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def claim(self, room: str, owner: str, ttl: float) -> bool:
+        now = time.time()
+        with self._connect() as conn:
+            cursor = conn.execute(
+                "INSERT INTO room_leases (room, owner, expires_at) VALUES (?, ?, ?) "
+                "ON CONFLICT(room) DO UPDATE SET owner = excluded.owner, expires_at = excluded.expires_at "
+                "WHERE room_leases.expires_at <= ?",
+                (room, owner, now + ttl, now)
+            )
+            return cursor.rowcount == 1
+
+    def renew(self, room: str, owner: str, ttl: float) -> bool:
+        now = time.time()
+        with self._connect() as conn:
+            # An expired lease may already be someone else's; don't revive it
+            cursor = conn.execute(
+                "UPDATE room_leases SET expires_at = ? WHERE room = ? AND owner = ? AND expires_at > ?",
+                (now + ttl, room, owner, now)
+            )
+            return cursor.rowcount == 1
+
+    def release(self, room: str, owner: str) -> None:
+        with self._connect() as conn:
+            conn.execute("DELETE FROM room_leases WHERE room = ? AND owner = ?", (room, owner))
+
+    def owner_of(self, room: str) -> Optional[str]:
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT owner FROM room_leases WHERE room = ? AND expires_at > ?",
+                (room, time.time())
+            ).fetchone()
+            return row[0] if row else None
+
+
+_RENEW_SCRIPT = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('pexpire', KEYS[1], ARGV[2])
+end
+return 0
+"""
+
+_RELEASE_SCRIPT = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('del', KEYS[1])
+end
+return 0
+"""
+
+
+class RedisRoomRegistry(RoomRegistry):
+    """Registry shared across hosts through a Redis-compatible client.
+
+    The client needs set(name, value, nx=, px=), get, pexpire and delete.
+    Clients that also provide eval (redis-py) get atomic compare-and-renew;
+    others fall back to get followed by the write.
+    """
+
+    def __init__(self, client, prefix: str = 'laingfy:room:'):
+        self.client = client
+        self.prefix = prefix
+
+    def _key(self, room: str) -> str:
+        return f"{self.prefix}{room}"
+
+    def _get(self, room: str) -> Optional[str]:
+        value = self.client.get(self._key(room))
+        if isinstance(value, bytes):
+            value = value.decode()
+        return value
+
+    def claim(self, room: str, owner: str, ttl: float) -> bool:
+        return bool(self.client.set(self._key(room), owner, nx=True, px=int(ttl * 1000)))
+
+    def renew(self, room: str, owner: str, ttl: float) -> bool:
+        if hasattr(self.client, 'eval'):
+            return bool(self.client.eval(_RENEW_SCRIPT, 1, self._key(room), owner, int(ttl * 1000)))
+        if self._get(room) != owner:
+            return False
+        return bool(self.client.pexpire(self._key(room), int(ttl * 1000)))
+
+    def release(self, room: str, owner: str) -> None:
+        if hasattr(self.client, 'eval'):
+            self.client.eval(_RELEASE_SCRIPT, 1, self._key(room), owner)
+        elif self._get(room) == owner:
+            self.client.delete(self._key(room))
+
+    def owner_of(self, room: str) -> Optional[str]:
+        return self._get(room)
+
+
+class RoomLease:
+    """A claimed room whose lease is renewed in the background until released.
+
+    lost is set when a renewal is refused, or when renewals keep failing for
+    a whole ttl; the agent for the room must stop once it is set.
+    """
+
+    def __init__(self, registry: RoomRegistry, room: str, owner: str, ttl: float):
+        self.registry = registry
+        self.room = room
+        self.owner = owner
+        self.ttl = ttl
+        self.lost = asyncio.Event()
+        self._heartbeat: Optional[asyncio.Task] = None
+
+    async def claim(self) -> bool:
+        """Claim the room and start renewing it; False if someone holds it"""
+        claimed = await asyncio.to_thread(self.registry.claim, self.room, self.owner, self.ttl)
+        if claimed:
+            self._heartbeat = asyncio.create_task(self._renew_until_released())
+        return claimed
+
+    async def release(self) -> None:
+        if self._heartbeat:
+            self._heartbeat.cancel()
+            self._heartbeat = None
+        try:
+            await asyncio.to_thread(self.registry.release, self.room, self.owner)
+        except Exception as e:
+            logger.error(f"Error releasing room {self.room}: {str(e)}", exc_info=True)
+
+    async def _renew_until_released(self) -> None:
+        renewed_at = time.monotonic()
+        while True:
+            await asyncio.sleep(self.ttl / 3)
+            try:
+                renewed = await asyncio.to_thread(self.registry.renew, self.room, self.owner, self.ttl)
+            except Exception as e:
+                # Keep trying; the lease is only gone once it has had time to expire
+                logger.error(f"Error renewing lease on room {self.room}: {str(e)}")
+                if time.monotonic() - renewed_at < self.ttl:
+                    continue
+                renewed = False
+            if not renewed:
+                logger.warning(f"Lost the lease on room {self.room}")
+                self.lost.set()
+                return
+            renewed_at = time.monotonic()
+
+
+class LocalRedis:
+    """In-process stand-in for the subset of Redis the registries use"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._data: Dict[str, Tuple[str, Optional[float]]] = {}
+
+    def _live(self, name: str) -> Optional[Tuple[str, Optional[float]]]:
+        entry = self._data.get(name)
+        if entry and entry[1] is not None and entry[1] <= time.monotonic():
+            del self._data[name]
+            return None
+        return entry
+
+    def set(self, name: str, value: str, nx: bool = False, px: Optional[int] = None) -> bool:
+        with self._lock:
+            if nx and self._live(name):
+                return False
+            expires_at = time.monotonic() + px / 1000 if px else None
+            self._data[name] = (value, expires_at)
+            return True
+
+    def get(self, name: str) -> Optional[str]:
+        with self._lock:
+            entry = self._live(name)
+            return entry[0] if entry else None
+
+    def pexpire(self, name: str, px: int) -> bool:
+        with self._lock:
+            entry = self._live(name)
+            if not entry:
+                return False
+            self._data[name] = (entry[0], time.monotonic() + px / 1000)
+            return True
+
+    def delete(self, name: str) -> int:
+        with self._lock:
+            return 1 if self._data.pop(name, None) else 0
+
+
+def create_room_registry(backend: str = ROOM_REGISTRY_BACKEND) -> RoomRegistry:
+    """Build the registry selected by ROOM_REGISTRY_BACKEND"""
+    if backend == 'redis':
+        if not REDIS_URL:
+            raise ValueError("REDIS_URL is not set")
+        import redis  # Only needed for the redis backend
+        logger.info("Using Redis room registry")
+        return RedisRoomRegistry(redis.Redis.from_url(REDIS_URL))
+    if backend == 'memory':
+        logger.info("Using in-process room registry")
+        return RedisRoomRegistry(LocalRedis())
+    logger.info(f"Using SQLite room registry at {ROOM_REGISTRY_PATH}")
+    return SQLiteRoomRegistry(ROOM_REGISTRY_PATH)
@@ -0,0 +1,69 @@
+import asyncio
+import logging
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class _Flight:
+    def __init__(self, task: asyncio.Task):
+        self.task = task
+        self.waiters = 0
+
+
+class SingleFlight:
+    """Coalesce concurrent calls that share a key onto one upstream call.
+
+    The first caller for a key starts the work in its own task; callers that
+    arrive while it is still running await the same task and share its result
+    or exception. Nothing is cached once the call finishes.
+    """
+
+    def __init__(self, name: str, max_waiters: int = 64):
+        self.name = name
+        self.max_waiters = max_waiters
+        self._flights: Dict[Hashable, _Flight] = {}
+
+    def in_flight(self) -> int:
+        return len(self._flights)
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable[Any]]) -> Any:
+        """Run fn() for key, or join the call already in flight for key"""
+        flight = self._flights.get(key)
+
+        if flight is not None and flight.waiters >= self.max_waiters:
+            # Too many callers on one key; start a new shared call for the
+            # overflow so one failure fans out to at most max_waiters callers
+            logger.info(f"[{self.name}] waiter limit reached for key, starting another shared call")
+            flight = None
+
+        if flight is None:
+            flight = _Flight(asyncio.create_task(fn()))
+            self._flights[key] = flight
+            flight.task.add_done_callback(lambda _t, k=key, f=flight: self._forget(k, f))
+        else:
+            logger.info(f"[{self.name}] joining in-flight call ({flight.waiters} waiting)")
+
+        flight.waiters += 1
+        try:
+            # shield() so one cancelled caller doesn't cancel the shared call
+            return await asyncio.shield(flight.task)
+        finally:
+            flight.waiters -= 1
+            if flight.waiters == 0 and not flight.task.done():
+                # Every caller has gone away; nobody needs the result anymore
+                logger.info(f"[{self.name}] all waiters cancelled, cancelling upstream call")
+                flight.task.cancel()
+                self._forget(key, flight)
+
+    def _forget(self, key: Hashable, flight: _Flight) -> None:
+        if self._flights.get(key) is flight:
+            del self._flights[key]
+        if flight.task.done() and not flight.task.cancelled():
+            # Mark the exception as retrieved when every waiter has already left
+            flight.task.exception()
+
+
+def normalize_text(text: Optional[str]) -> str:
+    """Normalize user input for use in a coalescing key"""
+    return ' '.join((text or '').split()).casefold()
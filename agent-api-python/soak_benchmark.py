@@ -0,0 +1,417 @@
+"""Soak benchmark for the LiveKit agent path without LiveKit or OpenAI.
+
+Runs the real /livekit-agent handler, create_and_start_agent and
+AgentPipeline against a fake rtc.Room and a fake realtime model that plays
+scripted turns. Rooms are ramped up in steps while participants join and
+leave, and the run reports rooms per core, memory per room, event-loop lag
+at each step and any tasks, sessions or rooms left behind after teardown.
+
+    python soak_benchmark.py --rooms 300 --step 50 --hold 10
+"""
+import argparse
+import asyncio
+import gc
+import json
+import os
+import random
+import resource
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+import weakref
+from types import SimpleNamespace
+
+# Keep module-level state in agent.py away from real services and files
+_tmpdir = tempfile.mkdtemp(prefix="soak-")
+os.environ.setdefault('OPENAI_API_KEY', 'soak-test')
+os.environ['AWS_S3_BUCKET_AUDIO'] = ''
+os.environ['ROOM_REGISTRY_BACKEND'] = 'memory'
+os.environ['TRANSCRIPT_DB_PATH'] = os.path.join(_tmpdir, 'transcripts.db')
+os.environ.pop('DEBUG_ENDPOINTS_TOKEN', None)
+# The soak sets its own room count; don't let the production room cap shed it
+os.environ['MAX_ACTIVE_ROOMS'] = '0'
+
+import aiohttp
+from livekit.agents import llm
+from starlette.requests import Request
+
+import agent
+import agent_pipeline
+from realtime_pool import RealtimeSessionPool
+
+LANGUAGES = ["English", "German", "Chinese", "Norwegian", "Portuguese (Brazilian)"]
+
+# Every fake room ever created, to spot rooms that are never freed
+_all_rooms = weakref.WeakSet()
+# Fake rooms by name; the benchmark passes the room name as the join token
+_rooms_by_name = weakref.WeakValueDictionary()
+
+
+class FakeEmitter:
+    """Minimal stand-in for the livekit EventEmitter (handlers in _events)"""
+
+    def __init__(self):
+        self._events = {}
+
+    def on(self, event, callback=None):
+        def register(handler):
+            self._events.setdefault(event, set()).add(handler)
+            return handler
+        return register(callback) if callback else register
+
+    def emit(self, event, *args):
+        for handler in list(self._events.get(event, ())):
+            handler(*args)
+
+
+class FakeParticipant:
+    def __init__(self, identity: str):
+        self.identity = identity
+
+
+class FakeRoom(FakeEmitter):
+    def __init__(self):
+        super().__init__()
+        self.remote_participants = {}
+        self.connected = False
+        _all_rooms.add(self)
+
+    async def connect(self, url, token, options=None):
+        _rooms_by_name[token] = self
+        await asyncio.sleep(random.uniform(0.005, 0.02))
+        self.connected = True
+        self.emit("connected")
+
+    async def disconnect(self):
+        self.connected = False
+
+    def join(self, identity: str):
+        participant = FakeParticipant(identity)
+        self.remote_participants[identity] = participant
+        self.emit("participant_connected", participant)
+
+    def leave(self, identity: str):
+        participant = self.remote_participants.pop(identity, None)
+        if participant:
+            self.emit("participant_disconnected", participant)
+
+
+class FakeRealtimeSession(FakeEmitter):
+    def __init__(self, connect_delay: float):
+        super().__init__()
+        self._session_id = "not-connected"
+        self._closed = asyncio.Event()
+        self._main_atask = asyncio.create_task(self._main_task(connect_delay))
+        self.conversation = SimpleNamespace(item=SimpleNamespace(create=lambda message: None))
+        self.response = SimpleNamespace(create=lambda: None)
+
+    @property
+    def closed(self) -> bool:
+        return self._closed.is_set()
+
+    async def _main_task(self, connect_delay: float):
+        await asyncio.sleep(connect_delay)
+        self._session_id = "fake-session"
+        await self._closed.wait()
+
+    async def aclose(self):
+        self._closed.set()
+        await self._main_atask
+
+
+class FakeRealtimeModel:
+    """Accepts the RealtimeModel constructor arguments and opens fake sessions"""
+
+    connect_delay = 0.3
+
+    def __init__(self, *args, http_session=None, **kwargs):
+        self.http_session = http_session
+        self.sessions = []
+
+    def session(self, **kwargs):
+        session = FakeRealtimeSession(self.connect_delay)
+        self.sessions.append(session)
+        return session
+
+    async def process_text(self, text: str):
+        await asyncio.sleep(0.01)
+        return SimpleNamespace(text=f"echo: {text}")
+
+    async def aclose(self):
+        for session in self.sessions:
+            await session.aclose()
+
+
+class FakeMultimodalAgent(FakeEmitter):
+    """Plays scripted speech turns until its realtime session is closed"""
+
+    turn_interval = 1.0
+
+    def __init__(self, *, model, **kwargs):
+        super().__init__()
+        self.model = model
+        self._script_task = None
+
+    def start(self, room, participant=None):
+        self._session = self.model.session(chat_ctx=None, fnc_ctx=None)
+        self._script_task = asyncio.create_task(self._script(room))
+
+    async def _script(self, room):
+        turn = 0
+        while not self._session.closed and room.connected:
+            try:
+                # Sleep until the next turn, but stop as soon as the session closes
+                await asyncio.wait_for(self._session._closed.wait(), random.uniform(0.5, 1.5) * self.turn_interval)
+                break
+            except asyncio.TimeoutError:
+                pass
+            turn += 1
+            self.emit("user_started_speaking")
+            self.emit("user_stopped_speaking")
+            self.emit("user_speech_committed", llm.ChatMessage(role="user", content=f"user turn {turn}"))
+            self.emit("agent_started_speaking")
+            self.emit("agent_stopped_speaking")
+            self.emit("agent_speech_committed", llm.ChatMessage(role="assistant", content=f"agent turn {turn}"))
+
+
+def install_fakes():
+    agent.rtc = SimpleNamespace(
+        Room=FakeRoom,
+        RoomOptions=lambda **kwargs: kwargs,
+        RtcConfiguration=lambda **kwargs: kwargs,
+    )
+    agent.multimodal = SimpleNamespace(MultimodalAgent=FakeMultimodalAgent)
+    agent.realtime_pool = RealtimeSessionPool(
+        model_factory=lambda language, http_session: FakeRealtimeModel(http_session=http_session)
+    )
+    agent_pipeline.openai = SimpleNamespace(
+        realtime=SimpleNamespace(RealtimeModel=FakeRealtimeModel, ServerVadOptions=lambda **kwargs: kwargs)
+    )
+    agent_pipeline.multimodal = SimpleNamespace(MultimodalAgent=FakeMultimodalAgent)
+
+
+def rss_bytes() -> int:
+    try:
+        with open('/proc/self/statm') as statm:
+            return int(statm.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError):
+        # ru_maxrss is a high-water mark in KiB on Linux, bytes on macOS
+        usage = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return usage if sys.platform == 'darwin' else usage * 1024
+
+
+def cpu_seconds() -> float:
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    return usage.ru_utime + usage.ru_stime
+
+
+def open_client_sessions() -> int:
+    return sum(1 for obj in gc.get_objects() if isinstance(obj, aiohttp.ClientSession) and not obj.closed)
+
+
+class LagMonitor:
+    """Measures how late a periodic timer fires on the event loop"""
+
+    def __init__(self, interval: float = 0.05):
+        self.interval = interval
+        self.samples = []
+        self._task = None
+
+    def start(self):
+        self._task = asyncio.create_task(self._run())
+
+    def reset(self):
+        self.samples = []
+
+    async def stop(self):
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+
+    def summary(self) -> dict:
+        if not self.samples:
+            return {"p50_ms": 0.0, "p99_ms": 0.0, "max_ms": 0.0}
+        ordered = sorted(self.samples)
+        return {
+            "p50_ms": round(statistics.median(ordered) * 1000, 2),
+            "p99_ms": round(ordered[min(len(ordered) - 1, int(len(ordered) * 0.99))] * 1000, 2),
+            "max_ms": round(ordered[-1] * 1000, 2),
+        }
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            expected = loop.time() + self.interval
+            await asyncio.sleep(self.interval)
+            self.samples.append(max(0.0, loop.time() - expected))
+
+
+class Soak:
+    def __init__(self, args):
+        self.args = args
+        self.counter = 0
+        self.lifecycle_tasks = set()
+        self.started_rooms = 0
+
+    async def start_room(self):
+        self.counter += 1
+        room_name = f"soak-room-{self.counter}"
+        request = agent.LiveKitRequest(
+            room=room_name,
+            language=random.choice(LANGUAGES),
+            token=room_name,
+            serverUrl="wss://soak.invalid",
+        )
+        # Each simulated learner calls from its own address
+        n = self.counter
+        http_request = Request({
+            "type": "http",
+            "headers": [],
+            "client": (f"10.{(n >> 16) & 255}.{(n >> 8) & 255}.{n & 255}", 0),
+        })
+        await agent.create_livekit_agent(request, http_request)
+        self.started_rooms += 1
+        task = asyncio.create_task(self._participant_lifecycle(room_name))
+        self.lifecycle_tasks.add(task)
+        task.add_done_callback(self.lifecycle_tasks.discard)
+
+    async def _participant_lifecycle(self, room_name: str):
+        await asyncio.sleep(random.uniform(0.05, 0.5))
+        room = _rooms_by_name.get(room_name)
+        if room is None:
+            return
+        identity = f"learner-{room_name}"
+        room.join(identity)
+        await asyncio.sleep(random.uniform(self.args.session_min, self.args.session_max))
+        room.leave(identity)
+
+    async def hold(self, target: int, seconds: float):
+        """Keep `target` rooms alive for `seconds`, replacing rooms that end"""
+        deadline = time.monotonic() + seconds
+        while time.monotonic() < deadline:
+            missing = target - len(agent.active_agents)
+            for _ in range(max(0, missing)):
+                await self.start_room()
+            await asyncio.sleep(0.1)
+
+    async def run_pipelines(self, count: int, turns: int):
+        async def one():
+            pipeline = agent_pipeline.AgentPipeline()
+            await pipeline.set_language(random.choice(LANGUAGES))
+            for turn in range(turns):
+                await pipeline.process_input(f"pipeline turn {turn}")
+            await pipeline.cleanup()
+
+        await asyncio.gather(*(one() for _ in range(count)))
+
+    async def teardown(self):
+        for room in list(_all_rooms):
+            for identity in list(room.remote_participants):
+                room.leave(identity)
+            # The server closes the room, including ones nobody joined
+            if room.connected:
+                room.emit("disconnected", "ROOM_DELETED")
+        for task in list(self.lifecycle_tasks):
+            task.cancel()
+        await asyncio.gather(*self.lifecycle_tasks, return_exceptions=True)
+        running = [task for task in agent.active_agents.values() if task]
+        if running:
+            await asyncio.wait(running, timeout=10)
+        await agent.realtime_pool.aclose()
+        await agent.transcript_sink.aclose()
+
+
+async def main(args) -> dict:
+    random.seed(args.seed)
+    FakeRealtimeModel.connect_delay = args.connect_delay
+    FakeMultimodalAgent.turn_interval = args.turn_interval
+    install_fakes()
+
+    # What the startup event does; names are unique per run, so keep the
+    # registry in memory and never let a previous claim block a room
+    agent.room_registry = agent.create_room_registry('memory')
+    agent.transcript_sink = agent.create_transcript_sink()
+    agent.transcript_sink.start()
+    agent.realtime_pool.start()
+
+    gc.collect()
+    baseline_tasks = set(asyncio.all_tasks())
+    baseline_rss = rss_bytes()
+    lag = LagMonitor()
+    lag.start()
+    soak = Soak(args)
+
+    steps = []
+    target = 0
+    while target < args.rooms:
+        target = min(args.rooms, target + args.step)
+        lag.reset()
+        wall_start, cpu_start = time.monotonic(), cpu_seconds()
+        await soak.hold(target, args.hold)
+        wall, cpu = time.monotonic() - wall_start, cpu_seconds() - cpu_start
+        live_rooms = len(agent.active_agents)
+        cores_used = cpu / wall if wall else 0.0
+        step = {
+            "target_rooms": target,
+            "live_rooms": live_rooms,
+            "rooms_started": soak.started_rooms,
+            "cores_used": round(cores_used, 3),
+            "rooms_per_core": round(live_rooms / cores_used, 1) if cores_used else None,
+            "rss_mb": round(rss_bytes() / 1e6, 1),
+            "memory_per_room_kb": round((rss_bytes() - baseline_rss) / max(live_rooms, 1) / 1024, 1),
+            "loop_lag": lag.summary(),
+            "transcripts": agent.transcript_sink.stats(),
+        }
+        steps.append(step)
+        print(json.dumps(step), file=sys.stderr)
+
+    pipeline_start = time.monotonic()
+    await soak.run_pipelines(args.pipelines, args.pipeline_turns)
+    pipeline_s = time.monotonic() - pipeline_start
+
+    await lag.stop()
+    await soak.teardown()
+    await asyncio.sleep(0.2)
+    gc.collect()
+
+    leaked_tasks = [task for task in asyncio.all_tasks() if task not in baseline_tasks and not task.done()]
+    return {
+        "config": vars(args),
+        "cpu_count": os.cpu_count(),
+        "steps": steps,
+        "pipelines": {"count": args.pipelines, "turns": args.pipeline_turns, "seconds": round(pipeline_s, 3)},
+        "realtime_pool": agent.realtime_pool.stats(),
+        "after_teardown": {
+            "active_agents": len(agent.active_agents),
+            "leaked_tasks": len(leaked_tasks),
+            "leaked_task_coroutines": sorted({task.get_coro().__qualname__ for task in leaked_tasks})[:20],
+            "open_client_sessions": open_client_sessions(),
+            "live_fake_rooms": len(_all_rooms),
+        },
+    }
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rooms", type=int, default=300, help="peak number of concurrent rooms")
+    parser.add_argument("--step", type=int, default=50, help="rooms added per ramp step")
+    parser.add_argument("--hold", type=float, default=10, help="seconds to hold each step")
+    parser.add_argument("--session-min", type=float, default=3, help="shortest participant session (s)")
+    parser.add_argument("--session-max", type=float, default=15, help="longest participant session (s)")
+    parser.add_argument("--turn-interval", type=float, default=1.0, help="mean seconds between scripted turns")
+    parser.add_argument("--connect-delay", type=float, default=0.3, help="fake realtime handshake time (s)")
+    parser.add_argument("--pipelines", type=int, default=50, help="AgentPipeline instances to cycle")
+    parser.add_argument("--pipeline-turns", type=int, default=5, help="process_input calls per pipeline")
+    parser.add_argument("--seed", type=int, default=1)
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    try:
+        print(json.dumps(asyncio.run(main(parse_args())), indent=2))
+    finally:
+        shutil.rmtree(_tmpdir, ignore_errors=True)
@@ -0,0 +1,158 @@
+import asyncio
+import time
+from types import SimpleNamespace
+
+import pytest
+
+import agentResponse
+from agentResponse import AgentResponse
+from deadline import Deadline, HedgeBudget
+
+
+class FakeSpeech:
+    """audio.speech stand-in; each call takes the next (delay, result) step"""
+
+    def __init__(self, steps):
+        self.steps = list(steps)
+        self.calls = 0
+        self.cancelled = 0
+
+    async def create(self, model, voice, input, timeout):
+        delay, result = self.steps[min(self.calls, len(self.steps) - 1)]
+        self.calls += 1
+        try:
+            await asyncio.sleep(delay)
+        except asyncio.CancelledError:
+            self.cancelled += 1
+            raise
+        if isinstance(result, Exception):
+            raise result
+        return SimpleNamespace(content=result)
+
+
+class FakeCompletions:
+    def __init__(self, content="Hallo! 👋"):
+        self.content = content
+        self.on_call = None
+
+    async def create(self, model, messages, temperature, max_tokens, timeout):
+        if self.on_call:
+            self.on_call()
+        return SimpleNamespace(
+            choices=[SimpleNamespace(finish_reason='stop', message=SimpleNamespace(content=self.content))],
+            usage=SimpleNamespace(completion_tokens=20)
+        )
+
+
+class FakeOpenAI:
+    def __init__(self, speech_steps):
+        self.audio = SimpleNamespace(speech=FakeSpeech(speech_steps))
+        self.chat = SimpleNamespace(completions=FakeCompletions())
+        self.options = []
+
+    def with_options(self, **options):
+        self.options.append(options)
+        return self
+
+
+@pytest.fixture
+def make_agent(monkeypatch):
+    monkeypatch.setattr(agentResponse, 'AWS_S3_BUCKET_AUDIO', '')
+    monkeypatch.setattr(agentResponse, 'AUDIO_DELIVERY_MODE', 'inline')
+    monkeypatch.setattr(agentResponse, 'TTS_HEDGE_ENABLED', True)
+    monkeypatch.setattr(agentResponse, 'TTS_HEDGE_DEFAULT_DELAY_S', 0.05)
+
+    def make(speech_steps):
+        agent = AgentResponse()
+        agent.openai_client = FakeOpenAI(speech_steps)
+        return agent
+
+    return make
+
+
+def test_hedge_fires_after_the_delay_and_the_faster_reply_wins(make_agent):
+    agent = make_agent([(1.0, b"primary"), (0.01, b"hedge")])
+
+    async def run():
+        started = time.monotonic()
+        response = await agent._create_speech("Hallo", 'onyx')
+        return response, time.monotonic() - started
+
+    response, elapsed = asyncio.run(run())
+    speech = agent.openai_client.audio.speech
+    assert response.content == b"hedge"
+    assert 0.05 <= elapsed < 0.5
+    assert speech.calls == 2
+    assert speech.cancelled == 1
+    assert agent.tts_hedge_budget.hedged == 1
+    # Only the hedge retries; the SDK must not resend behind its back
+    assert agent.openai_client.options == [{"max_retries": 0}]
+    # The losing primary still counts as a slow sample
+    assert max(agent.tts_latency.samples) >= 0.05
+
+
+def test_no_hedge_when_the_budget_is_spent(make_agent):
+    agent = make_agent([(0.15, b"primary"), (0.01, b"hedge")])
+    agent.tts_hedge_budget = HedgeBudget(max_rate=0, burst=0)
+
+    response = asyncio.run(agent._create_speech("Hallo", 'onyx'))
+    assert response.content == b"primary"
+    assert agent.openai_client.audio.speech.calls == 1
+    assert agent.tts_hedge_budget.denied == 1
+
+
+def test_primary_failing_before_the_delay_is_not_hedged(make_agent):
+    agent = make_agent([(0.01, RuntimeError("tts down")), (0.01, b"hedge")])
+
+    with pytest.raises(RuntimeError):
+        asyncio.run(agent._create_speech("Hallo", 'onyx'))
+    assert agent.openai_client.audio.speech.calls == 1
+    assert agent.tts_hedge_budget.hedged == 0
+
+
+def test_text_only_when_audio_misses_the_deadline(make_agent):
+    agent = make_agent([(5.0, b"slow")])
+
+    async def run():
+        started = time.monotonic()
+        result = await agent.process_input("Hallo", 'de', Deadline(0.3))
+        return result, time.monotonic() - started
+
+    result, elapsed = asyncio.run(run())
+    assert result == {"text": "Hallo! 👋", "audio_url": None, "audio_delivery": None}
+    assert elapsed < 1.0
+
+
+def test_text_only_when_the_completion_used_up_the_deadline(make_agent):
+    agent = make_agent([(0.0, b"fast")])
+    deadline = Deadline(5)
+
+    def spend_the_deadline():
+        deadline.expires_at = time.monotonic()
+
+    agent.openai_client.chat.completions.on_call = spend_the_deadline
+    result = asyncio.run(agent.process_input("Hallo", 'de', deadline))
+    assert result["text"] == "Hallo! 👋"
+    assert result["audio_url"] is None
+    assert agent.openai_client.audio.speech.calls == 0
+
+
+def test_audio_is_delivered_within_the_deadline(make_agent):
+    agent = make_agent([(0.0, b"clip")])
+
+    result = asyncio.run(agent.process_input("Hallo", 'de', Deadline(5)))
+    assert result["audio_delivery"] == 'inline'
+    assert result["audio_url"].startswith("data:audio/mpeg;base64,")
+
+
+def test_full_text_fallback_skipped_without_time_for_another_tts_call(make_agent, monkeypatch):
+    monkeypatch.setattr(agentResponse, 'TTS_TIMEOUT_S', 1.0)
+    agent = make_agent([(0.0, RuntimeError("tts down"))])
+
+    async def run(seconds):
+        return await agent._generate_audio_with_fallback("Hallo", "Hallo! 👋", 'de', Deadline(seconds))
+
+    assert asyncio.run(run(0.5)) is None
+    assert agent.openai_client.audio.speech.calls == 1
+    assert asyncio.run(run(5)) is None
+    assert agent.openai_client.audio.speech.calls == 3
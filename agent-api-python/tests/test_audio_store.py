@@ -0,0 +1,70 @@
+import time
+
+import pytest
+
+from audio_store import AudioStore, parse_range
+
+
+@pytest.mark.parametrize("header, expected", [
+    (None, None),
+    ("", None),
+    ("bytes=0-99", (0, 99)),
+    ("bytes=10-", (10, 999)),
+    ("bytes=990-2000", (990, 999)),
+    ("bytes=-100", (900, 999)),
+    ("bytes=-5000", (0, 999)),
+    ("bytes=5-5", (5, 5)),
+])
+def test_parse_range(header, expected):
+    assert parse_range(header, 1000) == expected
+
+
+@pytest.mark.parametrize("header", [
+    "bytes=5-3",      # last-pos before first-pos is invalid syntax
+    "bytes=0-1,5-9",  # multiple ranges are not served
+    "bytes=a-b",
+    "bytes=--5",
+    "items=0-10",
+])
+def test_parse_range_ignores_invalid_headers(header):
+    assert parse_range(header, 1000) is None
+
+
+@pytest.mark.parametrize("header", ["bytes=1000-", "bytes=1000-1005", "bytes=-0"])
+def test_parse_range_rejects_unsatisfiable(header):
+    with pytest.raises(ValueError):
+        parse_range(header, 1000)
+
+
+def test_store_round_trip():
+    store = AudioStore()
+    clip_id = store.put(b"abc", 'audio/mpeg')
+    clip = store.get(clip_id)
+    assert clip.data == b"abc"
+    assert clip.content_type == 'audio/mpeg'
+    assert store.get("missing") is None
+
+
+def test_store_evicts_oldest_over_byte_limit():
+    store = AudioStore(max_bytes=10)
+    first = store.put(b"x" * 6)
+    second = store.put(b"y" * 6)
+    assert store.get(first) is None
+    assert store.get(second) is not None
+    assert store.total_bytes == 6
+    assert store.put(b"z" * 11) is None
+
+
+def test_store_evicts_oldest_over_entry_limit():
+    store = AudioStore(max_entries=2)
+    ids = [store.put(bytes([i])) for i in range(3)]
+    assert store.get(ids[0]) is None
+    assert all(store.get(clip_id) for clip_id in ids[1:])
+
+
+def test_store_expires_clips():
+    store = AudioStore(ttl=0.01)
+    clip_id = store.put(b"abc")
+    time.sleep(0.02)
+    assert store.get(clip_id) is None
+    assert store.total_bytes == 0
@@ -0,0 +1,67 @@
+import time
+
+import pytest
+
+from deadline import Deadline, DeadlineExceeded, HedgeBudget, LatencyTracker
+
+
+def test_budget_is_clipped_to_what_is_left():
+    deadline = Deadline(1.0)
+    assert deadline.budget(0.2) == 0.2
+    assert 0.9 < deadline.budget(5.0) <= 1.0
+
+
+def test_budget_raises_once_the_deadline_has_passed():
+    deadline = Deadline(0.01)
+    time.sleep(0.02)
+    assert deadline.expired
+    assert deadline.remaining() == 0.0
+    with pytest.raises(DeadlineExceeded):
+        deadline.budget(5.0)
+
+
+def test_deadline_exceeded_is_a_timeout():
+    # Callers that already handle asyncio.TimeoutError also handle a spent deadline
+    assert issubclass(DeadlineExceeded, TimeoutError)
+
+
+def test_percentile_needs_min_samples():
+    tracker = LatencyTracker(min_samples=3)
+    tracker.record(1.0)
+    tracker.record(2.0)
+    assert tracker.percentile(0.95) is None
+    tracker.record(3.0)
+    assert tracker.percentile(0.95) == 3.0
+
+
+def test_percentile_over_rolling_window():
+    tracker = LatencyTracker(window=100, min_samples=1)
+    for i in range(1, 101):
+        tracker.record(float(i))
+    assert tracker.percentile(0.5) == 51.0
+    assert tracker.percentile(0.95) == 96.0
+    # Old samples fall out of the window
+    for _ in range(100):
+        tracker.record(0.5)
+    assert tracker.percentile(0.95) == 0.5
+
+
+def test_hedge_budget_spends_the_burst_then_earns_at_max_rate():
+    budget = HedgeBudget(max_rate=0.25, burst=2)
+    assert budget.try_hedge()
+    assert budget.try_hedge()
+    assert not budget.try_hedge()
+    for _ in range(3):
+        budget.on_request()
+    assert not budget.try_hedge()
+    budget.on_request()
+    assert budget.try_hedge()
+    assert (budget.hedged, budget.denied) == (3, 2)
+
+
+def test_hedge_budget_saves_at_most_burst():
+    budget = HedgeBudget(max_rate=0.5, burst=1)
+    for _ in range(100):
+        budget.on_request()
+    assert budget.try_hedge()
+    assert not budget.try_hedge()
@@ -0,0 +1,156 @@
+import pytest
+
+from model_router import ModelRouter, ReplySizes
+
+
+def make_router(**kwargs):
+    kwargs.setdefault('models', ['big', 'small'])
+    kwargs.setdefault('latency_slo', 100)
+    kwargs.setdefault('max_tokens', 700)
+    kwargs.setdefault('min_tokens', 120)
+    kwargs.setdefault('reply_min_samples', 5)
+    return ModelRouter(**kwargs)
+
+
+def learn_replies(router, language, tokens, count=10, truncated=False):
+    for _ in range(count):
+        router.record_reply(language, "", tokens, truncated)
+
+
+def test_unlearned_language_gets_the_full_budget():
+    router = make_router()
+    decision = router.route('de', "Hallo")
+    assert (decision.model, decision.max_tokens, decision.reason) == ('big', 700, "fits_slo")
+
+
+def test_budget_follows_the_learned_reply_size():
+    router = make_router(reply_headroom=1.25)
+    learn_replies(router, 'de', 200)
+    assert router.route('de', "").max_tokens == 250
+
+
+def test_reply_sizes_are_learned_per_language():
+    router = make_router()
+    learn_replies(router, 'en', 150)
+    learn_replies(router, 'zh', 450)
+    assert router.route('en', "Hello").max_tokens < router.route('zh', "你好").max_tokens
+    # Another language still has nothing learned
+    assert router.route('no', "Hei").max_tokens == 700
+
+
+def test_long_input_gets_a_longer_reply_budget():
+    router = make_router()
+    learn_replies(router, 'de', 200)
+    short = router.route('de', "Ich gehe.")
+    long = router.route('de', "Gestern bin ich mit meinen Freunden in die Stadt gegangen. " * 8)
+    assert long.max_tokens > short.max_tokens
+
+
+def test_budget_stays_within_min_and_max_tokens():
+    router = make_router()
+    learn_replies(router, 'en', 10)
+    learn_replies(router, 'zh', 5000)
+    assert router.route('en', "Hi").max_tokens == 120
+    assert router.route('zh', "你好").max_tokens == 700
+
+
+def test_budget_uses_the_p90_of_recent_replies():
+    router = make_router(reply_headroom=1.0)
+    for tokens in range(100, 200):
+        router.record_reply('de', "", tokens, False)
+    assert router.route('de', "").max_tokens == 190
+
+
+def test_truncated_replies_raise_the_next_budget():
+    router = make_router(reply_headroom=1.25)
+    learn_replies(router, 'de', 200)
+    first = router.route('de', "").max_tokens
+    learn_replies(router, 'de', first, count=20, truncated=True)
+    assert router.route('de', "").max_tokens > first
+
+
+def test_slo_caps_the_reply_on_the_fastest_model():
+    router = make_router(latency_slo=3)
+    for _ in range(30):
+        router.record('big', 100, 0.6 + 100 / 20)    # 20 tokens/s
+        router.record('small', 100, 0.6 + 100 / 50)  # 50 tokens/s
+    decision = router.route('de', "Hallo")
+    assert decision.model == 'small'
+    assert decision.reason == "capped_by_slo"
+    assert decision.max_tokens < 700
+    assert decision.estimated_s <= 3.01
+
+
+def test_slo_cap_never_goes_below_min_tokens():
+    router = make_router(latency_slo=1)
+    for _ in range(30):
+        router.record('big', 100, 10)
+        router.record('small', 100, 10)
+    assert router.route('de', "Hallo").max_tokens == 120
+
+
+def test_request_budget_tightens_the_slo():
+    router = make_router(latency_slo=100)
+    assert router.route('de', "Hallo").reason == "fits_slo"
+    assert router.route('de', "Hallo", budget_s=2).reason == "capped_by_slo"
+
+
+def test_switches_model_once_the_first_is_observed_slow():
+    router = make_router(latency_slo=5)
+    learn_replies(router, 'en', 160)
+    assert router.route('en', "Hi").model == 'big'
+    for _ in range(30):
+        router.record('big', 200, 20)
+    decision = router.route('en', "Hi")
+    assert (decision.model, decision.reason) == ('small', "fits_slo")
+
+
+def test_retry_truncated_doubles_the_budget_once():
+    router = make_router()
+    learn_replies(router, 'de', 160)
+    decision = router.route('de', "Hallo")
+    retry = router.retry_truncated('de', "Hallo", decision, remaining_s=60)
+    assert retry.max_tokens == min(700, decision.max_tokens * 2)
+    assert retry.reason == "retry_truncated"
+    assert router.retry_truncated('de', "Hallo", retry, remaining_s=60) is None
+
+
+def test_retry_truncated_needs_time_left():
+    router = make_router()
+    learn_replies(router, 'de', 160)
+    decision = router.route('de', "Hallo")
+    assert router.retry_truncated('de', "Hallo", decision, remaining_s=0.5) is None
+
+
+def test_no_retry_when_already_at_max_tokens():
+    router = make_router()
+    decision = router.route('de', "Hallo")
+    assert decision.max_tokens == 700
+    assert router.retry_truncated('de', "Hallo", decision, remaining_s=60) is None
+
+
+def test_truncation_rate_is_tracked_per_language():
+    router = make_router()
+    learn_replies(router, 'de', 200, count=8)
+    learn_replies(router, 'de', 250, count=2, truncated=True)
+    learn_replies(router, 'en', 100, count=4)
+    assert router.truncation_rate('de') == pytest.approx(0.2)
+    assert router.truncation_rate('en') == 0.0
+    assert router.truncation_rate('zh') == 0.0
+
+    languages = router.snapshot()["languages"]
+    assert languages['de']["replies"] == 10
+    assert languages['de']["truncated"] == 2
+    assert languages['de']["truncation_rate"] == 0.2
+    assert languages['en']["reply_tokens"] is None
+
+
+def test_reply_sizes_window_forgets_old_replies():
+    sizes = ReplySizes(window=10)
+    for _ in range(10):
+        sizes.record(500, 0, True)
+    for _ in range(10):
+        sizes.record(100, 0, False)
+    assert sizes.percentile(0.9, 5) == 100
+    assert sizes.truncation_rate() == 0.0
+    assert (sizes.replies, sizes.truncated) == (20, 10)
@@ -0,0 +1,192 @@
+import asyncio
+import hashlib
+import hmac
+import time
+
+import pytest
+from starlette.requests import Request
+
+import rate_limit
+from rate_limit import (
+    AdmissionController,
+    MemoryRateLimitBackend,
+    RateLimiter,
+    caller_identity,
+    client_address,
+    retry_after_header,
+    verify_caller_token,
+)
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(rate_limit.time, 'monotonic', clock)
+    return clock
+
+
+def make_request(headers=None, client='203.0.113.7'):
+    return Request({
+        "type": "http",
+        "headers": [(name.lower().encode(), value.encode()) for name, value in (headers or {}).items()],
+        "client": (client, 0),
+    })
+
+
+def sign(user_id, expires, secret='secret'):
+    payload = f"{user_id}.{expires}"
+    return f"{payload}.{hmac.new(secret.encode(), payload.encode(), hashlib.sha256).hexdigest()}"
+
+
+def test_bucket_allows_burst_then_refills(clock):
+    backend = MemoryRateLimitBackend()
+    rate = 1.0  # one token per second
+    assert [backend.take('k', rate, 3) for _ in range(3)] == [0, 0, 0]
+    assert backend.take('k', rate, 3) == pytest.approx(1.0)
+
+    clock.now += 0.5
+    assert backend.take('k', rate, 3) == pytest.approx(0.5)
+    clock.now += 0.5
+    assert backend.take('k', rate, 3) == 0
+
+
+def test_bucket_refill_is_capped_at_burst(clock):
+    backend = MemoryRateLimitBackend()
+    backend.take('k', 1.0, 2)
+    clock.now += 100
+    assert [backend.take('k', 1.0, 2) for _ in range(3)] == [0, 0, pytest.approx(1.0)]
+
+
+def test_buckets_are_per_key(clock):
+    backend = MemoryRateLimitBackend()
+    assert backend.take('a', 1.0, 1) == 0
+    assert backend.take('a', 1.0, 1) > 0
+    assert backend.take('b', 1.0, 1) == 0
+
+
+def test_least_recently_used_key_is_evicted(clock):
+    backend = MemoryRateLimitBackend(max_keys=2)
+    backend.take('a', 1.0, 1)
+    backend.take('b', 1.0, 1)
+    backend.take('c', 1.0, 1)
+    # 'a' was evicted, so it starts again with a full bucket
+    assert backend.take('a', 1.0, 1) == 0
+    assert backend.take('c', 1.0, 1) > 0
+
+
+def test_limiter_returns_retry_after(clock):
+    async def run():
+        limiter = RateLimiter('chat', per_minute=60, burst=2, backend=MemoryRateLimitBackend())
+        return [await limiter.check('user:1') for _ in range(3)], limiter.rejected
+
+    results, rejected = asyncio.run(run())
+    assert results[:2] == [None, None]
+    assert results[2] == pytest.approx(1.0)
+    assert rejected == 1
+
+
+def test_zero_rate_disables_limiter():
+    async def run():
+        limiter = RateLimiter('chat', per_minute=0, burst=0, backend=MemoryRateLimitBackend())
+        return [await limiter.check('user:1') for _ in range(100)]
+
+    assert asyncio.run(run()) == [None] * 100
+
+
+def test_admission_sheds_background_first():
+    admission = AdmissionController(max_inflight=4, background_share=0.5)
+    assert admission.try_acquire('background')
+    assert admission.try_acquire('background')
+    assert not admission.try_acquire('background')
+    assert admission.try_acquire('interactive')
+    assert admission.try_acquire('interactive')
+    assert not admission.try_acquire('interactive')
+    admission.release()
+    assert admission.try_acquire('interactive')
+    assert admission.stats()["shed"] == {'interactive': 1, 'background': 1}
+
+
+def test_retry_after_header_rounds_up():
+    assert retry_after_header(0.2) == {"Retry-After": "1"}
+    assert retry_after_header(2.1) == {"Retry-After": "3"}
+
+
+def test_verify_caller_token():
+    expires = int(time.time()) + 60
+    assert verify_caller_token(sign('user-1', expires), 'secret') == 'user-1'
+    assert verify_caller_token(sign('user.with.dots', expires), 'secret') == 'user.with.dots'
+
+
+@pytest.mark.parametrize("token", [
+    None,
+    "",
+    "garbage",
+    "user-1.notanumber.abc",
+    sign('user-1', int(time.time()) + 60, secret='other'),
+    sign('user-1', int(time.time()) - 1),
+    sign('', int(time.time()) + 60),
+])
+def test_verify_caller_token_rejects(token):
+    assert verify_caller_token(token, 'secret') is None
+
+
+def test_verify_caller_token_needs_a_secret():
+    assert verify_caller_token(sign('user-1', int(time.time()) + 60), '') is None
+
+
+def test_client_address_ignores_forwarded_for_without_trusted_proxies():
+    request = make_request({'x-forwarded-for': '198.51.100.1'}, client='10.0.0.1')
+    assert client_address(request, trusted_hops=0) == '10.0.0.1'
+
+
+def test_client_address_skips_trusted_proxies_only():
+    # The caller spoofed the first entry; the load balancer appended the real address
+    request = make_request({'x-forwarded-for': '198.51.100.1, 203.0.113.7'}, client='10.0.0.1')
+    assert client_address(request, trusted_hops=1) == '203.0.113.7'
+    request = make_request({'x-forwarded-for': '198.51.100.1, 203.0.113.7, 10.0.0.2'}, client='10.0.0.1')
+    assert client_address(request, trusted_hops=2) == '203.0.113.7'
+
+
+def test_client_address_with_missing_forwarded_for():
+    assert client_address(make_request(client='10.0.0.1'), trusted_hops=1) == '10.0.0.1'
+
+
+def test_caller_identity_prefers_a_valid_token(monkeypatch):
+    monkeypatch.setattr(rate_limit, 'CALLER_TOKEN_SECRET', 'secret')
+    monkeypatch.setattr(rate_limit, 'TRUSTED_PROXY_HOPS', 0)
+    token = sign('user-1', int(time.time()) + 60)
+    assert caller_identity(make_request({'x-caller-token': token})) == 'user:user-1'
+    assert caller_identity(make_request({'x-caller-token': token + '0'})) == 'ip:203.0.113.7'
+    # The old unauthenticated header is no longer trusted
+    assert caller_identity(make_request({'x-user-id': 'someone-else'})) == 'ip:203.0.113.7'
+
+
+def test_caller_identity_uses_forwarded_address_behind_trusted_proxies(monkeypatch):
+    monkeypatch.setattr(rate_limit, 'TRUSTED_PROXY_HOPS', 1)
+    request = make_request({'x-forwarded-for': '198.51.100.1'}, client='10.0.0.1')
+    assert caller_identity(request) == 'ip:198.51.100.1'
+
+
+def test_caller_identity_is_unknown_without_a_trusted_source(monkeypatch):
+    # Behind an unconfigured load balancer every peer address is the proxy's
+    monkeypatch.setattr(rate_limit, 'CALLER_TOKEN_SECRET', 'secret')
+    monkeypatch.setattr(rate_limit, 'TRUSTED_PROXY_HOPS', None)
+    assert caller_identity(make_request(client='10.0.0.1')) is None
+    token = sign('user-1', int(time.time()) + 60)
+    assert caller_identity(make_request({'x-caller-token': token}, client='10.0.0.1')) == 'user:user-1'
+
+
+def test_unknown_callers_are_not_limited(clock):
+    async def run():
+        limiter = RateLimiter('chat', per_minute=60, burst=2, backend=MemoryRateLimitBackend())
+        return [await limiter.check(None) for _ in range(100)], limiter.rejected
+
+    assert asyncio.run(run()) == ([None] * 100, 0)
@@ -0,0 +1,158 @@
+import asyncio
+
+from realtime_pool import RealtimeSessionPool
+
+
+class FakeRealtimeSession:
+    def __init__(self):
+        self._session_id = 'not-connected'
+        self._main_atask = asyncio.create_task(asyncio.sleep(3600))
+
+    def die(self):
+        self._main_atask.cancel()
+
+
+class FakeRealtimeModel:
+    """Stand-in for RealtimeModel that opens a fake session without a network"""
+
+    def __init__(self, language, http_session):
+        self.language = language
+        self.http_session = http_session
+        self.sessions = []
+        self.closed = False
+
+    def session(self, **kwargs):
+        session = FakeRealtimeSession()
+        self.sessions.append(session)
+        return session
+
+    async def aclose(self):
+        self.closed = True
+        for session in self.sessions:
+            session._main_atask.cancel()
+
+
+def make_pool(**kwargs):
+    kwargs.setdefault('size', 1)
+    kwargs.setdefault('idle_ttl', 60)
+    kwargs.setdefault('health_interval', 60)
+    return RealtimeSessionPool(model_factory=FakeRealtimeModel, **kwargs)
+
+
+def test_hit_after_warmup_and_miss_for_a_cold_language():
+    async def run():
+        pool = make_pool()
+        pool.start(['German'])
+        warmed = pool._idle['German'][0]
+        hit = pool.acquire('German')
+        miss = pool.acquire('Chinese')
+        stats = pool.stats()
+        await hit.aclose()
+        await miss.aclose()
+        await pool.aclose()
+        return warmed, hit, miss, stats
+
+    warmed, hit, miss, stats = asyncio.run(run())
+    assert hit is warmed
+    assert miss.language == 'Chinese'
+    assert (stats["hits"], stats["misses"]) == (1, 1)
+
+
+def test_acquire_refills_the_language():
+    async def run():
+        pool = make_pool(size=2)
+        pool.start(['German'])
+        warm = pool.acquire('German')
+        idle = list(pool._idle['German'])
+        await warm.aclose()
+        await pool.aclose()
+        return warm, idle
+
+    warm, idle = asyncio.run(run())
+    assert len(idle) == 2
+    assert warm not in idle
+
+
+def test_agent_gets_the_pre_opened_session():
+    async def run():
+        pool = make_pool()
+        warm = pool.acquire('German')
+        # MultimodalAgent.start() asks the model for a session; it must get ours
+        session = warm.model.session()
+        fresh = warm.model.session()
+        await warm.aclose()
+        await pool.aclose()
+        return warm, session, fresh
+
+    warm, session, fresh = asyncio.run(run())
+    assert session is warm.session
+    assert fresh is not warm.session
+
+
+def test_dead_and_stale_sessions_are_skipped_on_acquire():
+    async def run():
+        pool = make_pool(size=2)
+        pool.start(['German'])
+        dead, stale = pool._idle['German']
+        dead.session.die()
+        stale.created_at -= 120
+        await asyncio.sleep(0)
+        warm = pool.acquire('German')
+        await warm.aclose()
+        await pool.aclose()
+        return dead, stale, warm, pool.stats()
+
+    dead, stale, warm, stats = asyncio.run(run())
+    assert warm not in (dead, stale)
+    assert dead.model.closed and stale.model.closed
+    assert (stats["hits"], stats["misses"]) == (0, 1)
+
+
+def test_health_loop_replaces_dead_and_stale_sessions():
+    async def run():
+        pool = make_pool(size=2, idle_ttl=60, health_interval=0.05)
+        pool.start(['German'])
+        dead, stale = pool._idle['German']
+        dead.session.die()
+        stale.created_at -= 120
+        await asyncio.sleep(0.15)
+        idle = list(pool._idle['German'])
+        await pool.aclose()
+        return dead, stale, idle
+
+    dead, stale, idle = asyncio.run(run())
+    assert len(idle) == 2
+    assert dead not in idle and stale not in idle
+    assert dead.model.closed and dead.http_session.closed
+    assert stale.model.closed and stale.http_session.closed
+
+
+def test_aclose_closes_idle_sessions_and_their_http_sessions():
+    async def run():
+        pool = make_pool(size=2)
+        pool.start(['German', 'Chinese'])
+        idle = [warm for sessions in pool._idle.values() for warm in sessions]
+        await pool.aclose()
+        return idle, pool
+
+    idle, pool = asyncio.run(run())
+    assert len(idle) == 4
+    assert all(warm.model.closed for warm in idle)
+    assert all(warm.http_session.closed for warm in idle)
+    assert pool._health_task is None
+    assert not pool._closing
+
+
+def test_zero_size_pool_opens_on_demand_only():
+    async def run():
+        pool = make_pool(size=0)
+        pool.start(['German'])
+        warm = pool.acquire('German')
+        stats = pool.stats()
+        await warm.aclose()
+        await pool.aclose()
+        return stats, warm
+
+    stats, warm = asyncio.run(run())
+    assert stats == {"hits": 0, "misses": 1, "idle": {'German': 0}}
+    assert warm.http_session.closed
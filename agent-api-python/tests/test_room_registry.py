@@ -0,0 +1,118 @@
+import asyncio
+import time
+
+import pytest
+
+from room_registry import LocalRedis, RedisRoomRegistry, RoomLease, RoomRegistry, SQLiteRoomRegistry
+
+
+@pytest.fixture(params=['sqlite', 'redis'])
+def registry(request, tmp_path):
+    if request.param == 'sqlite':
+        return SQLiteRoomRegistry(str(tmp_path / 'rooms.db'))
+    return RedisRoomRegistry(LocalRedis())
+
+
+def test_base_registry_is_abstract():
+    with pytest.raises(TypeError):
+        RoomRegistry()
+
+
+def test_claim_is_exclusive(registry):
+    assert registry.claim('room', 'a', 30)
+    assert not registry.claim('room', 'b', 30)
+    assert registry.owner_of('room') == 'a'
+
+
+def test_claim_fails_for_a_room_we_already_hold(registry):
+    assert registry.claim('room', 'a', 30)
+    assert not registry.claim('room', 'a', 30)
+
+
+def test_renew_only_by_owner(registry):
+    registry.claim('room', 'a', 30)
+    assert registry.renew('room', 'a', 30)
+    assert not registry.renew('room', 'b', 30)
+    assert not registry.renew('other', 'a', 30)
+
+
+def test_expired_lease_can_be_claimed(registry):
+    registry.claim('room', 'a', 0.05)
+    time.sleep(0.1)
+    assert registry.owner_of('room') is None
+    assert not registry.renew('room', 'a', 30)
+    assert registry.claim('room', 'b', 30)
+    assert registry.owner_of('room') == 'b'
+
+
+def test_renew_extends_the_lease(registry):
+    registry.claim('room', 'a', 0.1)
+    time.sleep(0.06)
+    assert registry.renew('room', 'a', 0.2)
+    time.sleep(0.06)
+    assert registry.owner_of('room') == 'a'
+    assert not registry.claim('room', 'b', 30)
+
+
+def test_release_only_by_owner(registry):
+    registry.claim('room', 'a', 30)
+    registry.release('room', 'b')
+    assert registry.owner_of('room') == 'a'
+    registry.release('room', 'a')
+    assert registry.owner_of('room') is None
+    assert registry.claim('room', 'b', 30)
+
+
+def test_lease_heartbeat_keeps_the_room(registry):
+    async def run():
+        lease = RoomLease(registry, 'room', 'a', 0.15)
+        assert await lease.claim()
+        await asyncio.sleep(0.4)
+        owner = registry.owner_of('room')
+        await lease.release()
+        return owner, lease.lost.is_set(), registry.owner_of('room')
+
+    owner, lost, owner_after_release = asyncio.run(run())
+    assert owner == 'a'
+    assert not lost
+    assert owner_after_release is None
+
+
+def test_lease_is_lost_when_renewal_is_refused(registry):
+    async def run():
+        lease = RoomLease(registry, 'room', 'a', 0.15)
+        assert await lease.claim()
+        # Another owner takes over, e.g. after this replica stalled
+        registry.release('room', 'a')
+        registry.claim('room', 'b', 30)
+        await asyncio.wait_for(lease.lost.wait(), 1)
+        await lease.release()
+        return registry.owner_of('room')
+
+    assert asyncio.run(run()) == 'b'
+
+
+def test_lease_is_lost_after_renewals_fail_for_a_ttl(registry):
+    class FailingRenewals:
+        def __init__(self, inner):
+            self.inner = inner
+
+        def claim(self, *args):
+            return self.inner.claim(*args)
+
+        def renew(self, *args):
+            raise ConnectionError("registry unavailable")
+
+        def release(self, *args):
+            return self.inner.release(*args)
+
+    async def run():
+        lease = RoomLease(FailingRenewals(registry), 'room', 'a', 0.15)
+        assert await lease.claim()
+        started = time.monotonic()
+        await asyncio.wait_for(lease.lost.wait(), 1)
+        elapsed = time.monotonic() - started
+        await lease.release()
+        return elapsed
+
+    assert asyncio.run(run()) >= 0.15
@@ -0,0 +1,142 @@
+import asyncio
+
+import pytest
+
+from single_flight import SingleFlight, normalize_text
+
+
+class Upstream:
+    """Counts calls and blocks until released"""
+
+    def __init__(self):
+        self.calls = 0
+        self.cancelled = 0
+        self.release = asyncio.Event()
+
+    async def __call__(self):
+        self.calls += 1
+        try:
+            await self.release.wait()
+        except asyncio.CancelledError:
+            self.cancelled += 1
+            raise
+        return f"result {self.calls}"
+
+
+def test_concurrent_callers_share_one_call():
+    async def run():
+        flight = SingleFlight('test')
+        upstream = Upstream()
+        callers = [asyncio.create_task(flight.do('key', upstream)) for _ in range(5)]
+        await asyncio.sleep(0)
+        upstream.release.set()
+        results = await asyncio.gather(*callers)
+        return upstream.calls, results, flight.in_flight()
+
+    calls, results, in_flight = asyncio.run(run())
+    assert calls == 1
+    assert results == ["result 1"] * 5
+    assert in_flight == 0
+
+
+def test_different_keys_do_not_coalesce():
+    async def run():
+        flight = SingleFlight('test')
+        upstream = Upstream()
+        callers = [asyncio.create_task(flight.do(key, upstream)) for key in ('a', 'b')]
+        await asyncio.sleep(0)
+        upstream.release.set()
+        await asyncio.gather(*callers)
+        return upstream.calls
+
+    assert asyncio.run(run()) == 2
+
+
+def test_overflow_callers_share_a_second_call():
+    async def run():
+        flight = SingleFlight('test', max_waiters=2)
+        upstream = Upstream()
+        callers = [asyncio.create_task(flight.do('key', upstream)) for _ in range(5)]
+        await asyncio.sleep(0)
+        upstream.release.set()
+        await asyncio.gather(*callers)
+        return upstream.calls
+
+    # Five callers in groups of at most two
+    assert asyncio.run(run()) == 3
+
+
+def test_exception_is_shared_by_all_waiters():
+    async def run():
+        flight = SingleFlight('test')
+        calls = 0
+
+        async def failing():
+            nonlocal calls
+            calls += 1
+            await asyncio.sleep(0.01)
+            raise RuntimeError("upstream failed")
+
+        results = await asyncio.gather(*(flight.do('key', failing) for _ in range(3)), return_exceptions=True)
+        return calls, results
+
+    calls, results = asyncio.run(run())
+    assert calls == 1
+    assert all(isinstance(result, RuntimeError) for result in results)
+
+
+def test_cancelling_one_waiter_keeps_the_shared_call():
+    async def run():
+        flight = SingleFlight('test')
+        upstream = Upstream()
+        first = asyncio.create_task(flight.do('key', upstream))
+        second = asyncio.create_task(flight.do('key', upstream))
+        await asyncio.sleep(0)
+        first.cancel()
+        await asyncio.sleep(0)
+        upstream.release.set()
+        return upstream, await second, first.cancelled()
+
+    upstream, result, first_cancelled = asyncio.run(run())
+    assert first_cancelled
+    assert result == "result 1"
+    assert upstream.cancelled == 0
+
+
+def test_cancelling_every_waiter_cancels_upstream():
+    async def run():
+        flight = SingleFlight('test')
+        upstream = Upstream()
+        callers = [asyncio.create_task(flight.do('key', upstream)) for _ in range(2)]
+        await asyncio.sleep(0)
+        for caller in callers:
+            caller.cancel()
+        await asyncio.gather(*callers, return_exceptions=True)
+        await asyncio.sleep(0)
+        return upstream.cancelled, flight.in_flight()
+
+    cancelled, in_flight = asyncio.run(run())
+    assert cancelled == 1
+    assert in_flight == 0
+
+
+def test_new_call_starts_after_all_waiters_cancelled():
+    async def run():
+        flight = SingleFlight('test')
+        upstream = Upstream()
+        caller = asyncio.create_task(flight.do('key', upstream))
+        await asyncio.sleep(0)
+        caller.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await caller
+        upstream.release.set()
+        return await flight.do('key', upstream), upstream.calls
+
+    result, calls = asyncio.run(run())
+    assert result == "result 2"
+    assert calls == 2
+
+
+def test_normalize_text():
+    assert normalize_text("  Hallo,\n  WIE geht's ") == "hallo, wie geht's"
+    assert normalize_text(None) == ""
@@ -0,0 +1,129 @@
+import asyncio
+import sqlite3
+
+import pytest
+
+from transcript_sink import SQLiteTranscriptStore, TranscriptSink, TranscriptStore
+
+
+class MemoryStore(TranscriptStore):
+    def __init__(self, fail: bool = False):
+        self.batches = []
+        self.fail = fail
+
+    def write_batch(self, entries):
+        if self.fail:
+            raise OSError("disk full")
+        self.batches.append([(e.room, e.role, e.content) for e in entries])
+
+    @property
+    def entries(self):
+        return [entry for batch in self.batches for entry in batch]
+
+
+def test_store_is_abstract():
+    with pytest.raises(TypeError):
+        TranscriptStore()
+
+
+def test_ring_buffer_drops_oldest_lines_per_room():
+    sink = TranscriptSink(MemoryStore(), max_per_room=3)
+    for i in range(5):
+        sink.record('room', 'user', f"line {i}")
+    assert sink.pending == 3
+    assert sink.dropped == 2
+    assert [e.content for e in sink._buffers['room']] == ["line 2", "line 3", "line 4"]
+
+
+def test_new_lines_dropped_when_backlog_is_full():
+    sink = TranscriptSink(MemoryStore(), max_per_room=10, max_pending=4)
+    for room in ('a', 'b', 'c'):
+        sink.record(room, 'user', "one")
+        sink.record(room, 'agent', "two")
+    assert sink.pending == 4
+    assert sink.dropped == 2
+    assert 'c' not in sink._buffers
+
+
+def test_flush_room_writes_only_that_room():
+    async def run():
+        store = MemoryStore()
+        sink = TranscriptSink(store)
+        sink.record('a', 'user', "hello")
+        sink.record('a', 'agent', "hallo")
+        sink.record('b', 'user', "hi")
+        await sink.flush_room('a')
+        return store, sink.stats()
+
+    store, stats = asyncio.run(run())
+    assert store.entries == [('a', 'user', "hello"), ('a', 'agent', "hallo")]
+    assert stats == {"rooms": 1, "pending": 1, "written": 2, "dropped": 0}
+
+
+def test_writer_flushes_in_batches():
+    async def run():
+        store = MemoryStore()
+        sink = TranscriptSink(store, batch_size=2, flush_interval=10)
+        sink.start()
+        for i in range(5):
+            sink.record('room', 'user', f"line {i}")
+        # A full batch wakes the writer without waiting for flush_interval
+        for _ in range(100):
+            if sink.written == 5:
+                break
+            await asyncio.sleep(0.01)
+        await sink.aclose()
+        return store, sink.stats()
+
+    store, stats = asyncio.run(run())
+    assert [len(batch) for batch in store.batches] == [2, 2, 1]
+    assert stats == {"rooms": 0, "pending": 0, "written": 5, "dropped": 0}
+
+
+def test_aclose_writes_everything_pending():
+    async def run():
+        store = MemoryStore()
+        sink = TranscriptSink(store, flush_interval=10)
+        sink.start()
+        sink.record('a', 'user', "one")
+        sink.record('b', 'user', "two")
+        await sink.aclose()
+        return store, sink.stats()
+
+    store, stats = asyncio.run(run())
+    assert sorted(store.entries) == [('a', 'user', "one"), ('b', 'user', "two")]
+    assert stats["pending"] == 0
+    assert stats["written"] == 2
+
+
+def test_failed_write_counts_entries_as_dropped():
+    async def run():
+        sink = TranscriptSink(MemoryStore(fail=True))
+        sink.record('a', 'user', "one")
+        sink.record('a', 'agent', "two")
+        await sink.flush_room('a')
+        return sink.stats()
+
+    assert asyncio.run(run()) == {"rooms": 0, "pending": 0, "written": 0, "dropped": 2}
+
+
+def test_sqlite_store_tracks_usage(tmp_path):
+    path = str(tmp_path / 'transcripts.db')
+
+    async def run():
+        sink = TranscriptSink(SQLiteTranscriptStore(path))
+        sink.record('room', 'user', "hallo", 'German')
+        sink.record('room', 'agent', "hallo zurück", 'German')
+        sink.record('room', 'user', "danke", 'German')
+        await sink.flush_room('room')
+
+    asyncio.run(run())
+    conn = sqlite3.connect(path)
+    try:
+        assert conn.execute("SELECT COUNT(*) FROM transcripts").fetchone()[0] == 3
+        usage = conn.execute(
+            "SELECT user_turns, agent_turns, user_chars, agent_chars FROM room_usage WHERE room = 'room'"
+        ).fetchone()
+    finally:
+        conn.close()
+    assert usage == (2, 1, len("hallo") + len("danke"), len("hallo zurück"))
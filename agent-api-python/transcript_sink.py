@@ -0,0 +1,220 @@
+import asyncio
+import logging
+import os
+import sqlite3
+import time
+from abc import ABC, abstractmethod
+from collections import deque
+from contextlib import contextmanager
+from typing import Deque, Dict, Iterator, List, Optional
+
+logger = logging.getLogger(__name__)
+
+TRANSCRIPT_DB_PATH = os.getenv('TRANSCRIPT_DB_PATH', 'transcripts.db')
+TRANSCRIPT_MAX_PER_ROOM = int(os.getenv('TRANSCRIPT_MAX_PER_ROOM', '500'))
+TRANSCRIPT_MAX_PENDING = int(os.getenv('TRANSCRIPT_MAX_PENDING', '10000'))
+TRANSCRIPT_BATCH_SIZE = int(os.getenv('TRANSCRIPT_BATCH_SIZE', '200'))
+TRANSCRIPT_FLUSH_INTERVAL_S = float(os.getenv('TRANSCRIPT_FLUSH_INTERVAL_S', '2'))
+
+
+class TranscriptEntry:
+    __slots__ = ('room', 'role', 'content', 'language', 'created_at')
+
+    def __init__(self, room: str, role: str, content: str, language: Optional[str], created_at: float):
+        self.room = room
+        self.role = role
+        self.content = content
+        self.language = language
+        self.created_at = created_at
+
+
+class TranscriptStore(ABC):
+    """Destination for transcript batches. write_batch is called off the event loop."""
+
+    @abstractmethod
+    def write_batch(self, entries: List[TranscriptEntry]) -> None:
+        """Persist one batch; raising drops the batch and counts it as dropped"""
+
+
+class SQLiteTranscriptStore(TranscriptStore):
+    """Stores transcript lines and per-room usage totals in a SQLite file"""
+
+    def __init__(self, path: str = TRANSCRIPT_DB_PATH):
+        self.path = path
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS transcripts ("
+                "id INTEGER PRIMARY KEY AUTOINCREMENT, room TEXT NOT NULL, role TEXT NOT NULL, "
+                "content TEXT NOT NULL, language TEXT, created_at REAL NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_transcripts_room ON transcripts (room, created_at)")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS room_usage ("
+                "room TEXT PRIMARY KEY, language TEXT, user_turns INTEGER NOT NULL DEFAULT 0, "
+                "agent_turns INTEGER NOT NULL DEFAULT 0, user_chars INTEGER NOT NULL DEFAULT 0, "
+                "agent_chars INTEGER NOT NULL DEFAULT 0, first_at REAL, last_at REAL)"
+            )
+
+    @contextmanager
+    def _connect(self) -> Iterator[sqlite3.Connection]:
+        conn = sqlite3.connect(self.path, timeout=5)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def write_batch(self, entries: List[TranscriptEntry]) -> None:
+        with self._connect() as conn:
+            conn.executemany(
+                "INSERT INTO transcripts (room, role, content, language, created_at) VALUES (?, ?, ?, ?, ?)",
+                [(e.room, e.role, e.content, e.language, e.created_at) for e in entries]
+            )
+            conn.executemany(
+                "INSERT INTO room_usage (room, language, user_turns, agent_turns, user_chars, agent_chars, first_at, last_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?) "
+                "ON CONFLICT(room) DO UPDATE SET "
+                "user_turns = user_turns + excluded.user_turns, agent_turns = agent_turns + excluded.agent_turns, "
+                "user_chars = user_chars + excluded.user_chars, agent_chars = agent_chars + excluded.agent_chars, "
+                "last_at = MAX(last_at, excluded.last_at)",
+                [
+                    (
+                        e.room,
+                        e.language,
+                        1 if e.role == 'user' else 0,
+                        1 if e.role == 'agent' else 0,
+                        len(e.content) if e.role == 'user' else 0,
+                        len(e.content) if e.role == 'agent' else 0,
+                        e.created_at,
+                        e.created_at,
+                    )
+                    for e in entries
+                ]
+            )
+
+
+class TranscriptSink:
+    """Buffers transcript events per room and writes them in batches.
+
+    record() never blocks the realtime loop: each room keeps a bounded ring
+    buffer (oldest lines are dropped when it is full) and new lines are
+    dropped outright once the total backlog hits max_pending. A background
+    writer drains the buffers every flush_interval seconds, or sooner when a
+    full batch is waiting.
+    """
+
+    def __init__(
+        self,
+        store: TranscriptStore,
+        max_per_room: int = TRANSCRIPT_MAX_PER_ROOM,
+        max_pending: int = TRANSCRIPT_MAX_PENDING,
+        batch_size: int = TRANSCRIPT_BATCH_SIZE,
+        flush_interval: float = TRANSCRIPT_FLUSH_INTERVAL_S,
+    ):
+        self.store = store
+        self.max_per_room = max_per_room
+        self.max_pending = max_pending
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.pending = 0
+        self.dropped = 0
+        self.written = 0
+        self._buffers: Dict[str, Deque[TranscriptEntry]] = {}
+        self._batch_ready = asyncio.Event()
+        self._write_lock = asyncio.Lock()
+        self._writer_task: Optional[asyncio.Task] = None
+
+    def start(self) -> None:
+        if self._writer_task is None:
+            self._writer_task = asyncio.create_task(self._writer())
+
+    def record(self, room: str, role: str, content, language: Optional[str] = None) -> None:
+        """Queue one transcript line; never blocks"""
+        if not isinstance(content, str):
+            content = str(content)
+        if self.pending >= self.max_pending:
+            self._drop()
+            return
+
+        buffer = self._buffers.get(room)
+        if buffer is None:
+            buffer = self._buffers[room] = deque(maxlen=self.max_per_room)
+        if len(buffer) == buffer.maxlen:
+            # The ring buffer evicts the oldest line to make room
+            self.pending -= 1
+            self._drop()
+        buffer.append(TranscriptEntry(room, role, content, language, time.time()))
+        self.pending += 1
+
+        if self.pending >= self.batch_size:
+            self._batch_ready.set()
+
+    async def flush_room(self, room: str) -> None:
+        """Write everything buffered for room, e.g. on room teardown"""
+        buffer = self._buffers.pop(room, None)
+        if buffer:
+            entries = list(buffer)
+            self.pending -= len(entries)
+            await self._write(entries)
+
+    async def aclose(self) -> None:
+        if self._writer_task:
+            self._writer_task.cancel()
+            self._writer_task = None
+        await self._write(self._drain(self.pending))
+
+    def stats(self) -> dict:
+        return {
+            "rooms": len(self._buffers),
+            "pending": self.pending,
+            "written": self.written,
+            "dropped": self.dropped,
+        }
+
+    async def _writer(self) -> None:
+        while True:
+            try:
+                await asyncio.wait_for(self._batch_ready.wait(), self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._batch_ready.clear()
+            while self.pending:
+                entries = self._drain(self.batch_size)
+                if not entries:
+                    break
+                await self._write(entries)
+
+    def _drain(self, limit: int) -> List[TranscriptEntry]:
+        entries = []
+        for room in list(self._buffers):
+            buffer = self._buffers[room]
+            while buffer and len(entries) < limit:
+                entries.append(buffer.popleft())
+            if not buffer:
+                del self._buffers[room]
+            if len(entries) >= limit:
+                break
+        self.pending -= len(entries)
+        return entries
+
+    async def _write(self, entries: List[TranscriptEntry]) -> None:
+        if not entries:
+            return
+        async with self._write_lock:
+            try:
+                await asyncio.to_thread(self.store.write_batch, entries)
+                self.written += len(entries)
+            except Exception as e:
+                # Transcripts are best effort; never take the agent down with them
+                self.dropped += len(entries)
+                logger.error(f"Error writing {len(entries)} transcript entries: {str(e)}", exc_info=True)
+
+    def _drop(self) -> None:
+        self.dropped += 1
+        if self.dropped == 1 or self.dropped % 1000 == 0:
+            logger.warning(f"Transcript backlog full, {self.dropped} entries dropped so far")
+
+
+def create_transcript_sink() -> TranscriptSink:
+    return TranscriptSink(SQLiteTranscriptStore(TRANSCRIPT_DB_PATH))
@@ -0,0 +1,31 @@
+import { createHmac } from "crypto";
+import { getServerSession } from "next-auth";
+import { NextResponse } from "next/server";
+import { authOptions } from "@/lib/auth";
+
+// Lifetime of a caller token for the Python agent API
+const CALLER_TOKEN_TTL_SECONDS = 15 * 60;
+
+// Signs "<user id>.<expires>" so the agent API can rate limit per user
+export async function GET() {
+  try {
+    const session = await getServerSession(authOptions);
+    if (!session?.user?.id) {
+      return new NextResponse("Unauthorized", { status: 401 });
+    }
+
+    const secret = process.env.CALLER_TOKEN_SECRET;
+    if (!secret) {
+      return NextResponse.json({ error: "Caller tokens are not configured" }, { status: 503 });
+    }
+
+    const expiresAt = Math.floor(Date.now() / 1000) + CALLER_TOKEN_TTL_SECONDS;
+    const payload = `${session.user.id}.${expiresAt}`;
+    const signature = createHmac("sha256", secret).update(payload).digest("hex");
+
+    return NextResponse.json({ token: `${payload}.${signature}`, expiresAt });
+  } catch (error) {
+    console.error("[CALLER_TOKEN_GET]", error instanceof Error ? error.message : error);
+    return NextResponse.json({ error: "Internal Server Error" }, { status: 500 });
+  }
+}
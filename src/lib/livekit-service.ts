@@ -16,6 +16,7 @@ export class LiveKitService {
   private mediaRecorder: MediaRecorder | null = null
   private audioChunks: Blob[] = []
   private audioTrack: LocalTrack | null = null
+  private callerToken: { token: string; expiresAt: number } | null = null
 
   constructor() {
     this.room = new Room()
@@ -23,6 +24,21 @@ export class LiveKitService {
     console.log('LiveKitService initialized')
   }
 
+  // Signed user identity for the Python API's per-user rate limits
+  private async getCallerHeaders(): Promise<Record<string, string>> {
+    const now = Date.now() / 1000
+    if (!this.callerToken || this.callerToken.expiresAt - 60 < now) {
+      try {
+        const response = await fetch('/api/user/caller-token')
+        this.callerToken = response.ok ? await response.json() : null
+      } catch (error) {
+        console.error('Error fetching caller token:', error)
+        this.callerToken = null
+      }
+    }
+    return this.callerToken ? { 'x-caller-token': this.callerToken.token } : {}
+  }
+
   private setupRoomEventHandlers() {
     this.room.on(RoomEvent.ParticipantConnected, () => {
       console.log('Participant connected')
@@ -45,7 +61,8 @@ export class LiveKitService {
         const response = await fetch('http://localhost:8000/chat', {
           method: 'POST',
           headers: {
-            'Content-Type': 'application/json'
+            'Content-Type': 'application/json',
+            ...(await this.getCallerHeaders())
           },
           body: JSON.stringify({
             message: data.content,